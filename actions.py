@@ -1,10 +1,15 @@
+from collections import OrderedDict
 import datafile
-import json
+import datastore
 import os
+import threading
 import tronix
-from typing import Any
+from typing import Any, Callable
 
 ACTIONS_PATH = datafile.makepath("actions.json")
+SCRIPT_CACHE_SIZE = 256 #parsed and compiled scripts kept around
+
+action_store = datastore.table("actions", ACTIONS_PATH)
 
 class ActionRequestedValue:
     def __init__(self, name:str, t:type, required:bool=True):
@@ -121,23 +126,184 @@ class Action:
 
 script_runner = tronix.utils.ScriptRunner()
 
+def script_hash(raw:str)->bytes:
+    return tronix.Script.HASH_FUNC(raw.encode("utf-8"), usedforsecurity=False).digest()
+
+#attributes of a Script that preparing it set, shared by every run of the script
+PreparedState = dict[str, Any]
+
+def _same(a, b)->bool:
+    if a is b:
+        return True
+    try:
+        return type(a) is type(b) and bool(a == b)
+    except Exception:
+        return False
+
+def prepared_state(raw:str)->PreparedState:
+    """Prepares the script and returns what that changed, compared to a Script that was only constructed.
+
+    The scope, and anything else the constructor sets up the same way, is left out: that's per-run state, which each run
+    gets a new one of from constructing its own Script."""
+    program = script_runner._prep(raw)
+    fresh = vars(tronix.Script(raw))
+    return {name:value for name, value in vars(program).items() if name != "scope" and (name not in fresh or not _same(fresh[name], value))}
+
+def bind_script(raw:str, state:PreparedState, scope:tronix.script.Namespace|None=None)->tronix.Script:
+    """Returns a new Script to run with `scope`, which shares the prepared state instead of parsing and compiling again."""
+    s = tronix.Script(raw, scope)
+    vars(s).update(state)
+    return s
+
+class ScriptCache:
+    """Parsed and compiled scripts by their hash, so running an action again only binds a new scope to its program.
+
+    Scripts are prepared by `script_runner._prep(raw)`, like `check_script` does, and only what that adds to them is
+    cached, each run gets a new Script from `bind_script`. The least recently used scripts are dropped once there are more than `maxsize`.
+    Edited scripts hash differently, so old versions just age out."""
+    def __init__(self, maxsize:int=SCRIPT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.scripts:OrderedDict[bytes, PreparedState] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def prepare(self, raw:str)->PreparedState:
+        """Returns the cached prepared state of the script. Raises a TronixException if it doesn't parse or compile."""
+        h = script_hash(raw)
+        with self._lock:
+            state = self.scripts.get(h, None)
+            if state is not None:
+                self.scripts.move_to_end(h)
+                self.hits += 1
+                return state
+        state = prepared_state(raw)
+        with self._lock:
+            self.misses += 1
+            self.scripts[h] = state
+            while len(self.scripts) > self.maxsize:
+                self.scripts.popitem(last=False)
+                self.evictions += 1
+        return state
+
+    def get(self, raw:str, scope:tronix.script.Namespace|None=None)->tronix.Script:
+        """Returns a new Script to run with `scope`.
+
+        Runners that run scripts somewhere else (`prepare_locally = False`) get a plain Script, since they only send its source."""
+        if not getattr(script_runner, "prepare_locally", True):
+            return tronix.Script(raw, scope)
+        return bind_script(raw, self.prepare(raw), scope)
+
+    def clear(self):
+        with self._lock:
+            self.scripts.clear()
+
+    def metrics(self)->dict[str, int]:
+        return {"size": len(self.scripts), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+script_cache = ScriptCache()
+
+def _action_from_state(d:dict[str])->Action:
+    action = Action.__new__(Action)
+    action.__setstate__(d)
+    return action
+
+class ActionRegistry:
+    """Process-wide cache of the action table for lookups that happen on every command and redeem.
+
+    The table is only reloaded when its version changes (which includes other processes writing to it),
+    and only the actions whose contents changed are rebuilt. Writes made through this module are applied directly.
+    The cached actions are shared, so use `get_action` or `load_action` to get one that can be modified."""
+
+    def __init__(self, store:datastore.Table):
+        self.store = store
+        self.generation = 0
+        self._version = None
+        self._rows:dict[str, dict[str]] = {}
+        self._actions:dict[str, Action] = {}
+        self._lock = threading.Lock()
+
+    def covers(self, path:str|None)->bool:
+        return path is None or os.path.abspath(path) == os.path.abspath(self.store.json_path)
+
+    def refresh(self)->int:
+        """Reloads the table if it changed. Returns the generation, which changes whenever any cached action does."""
+        version = self.store.version()
+        if version == self._version:
+            return self.generation
+        with self._lock:
+            if version == self._version:
+                return self.generation
+            rows = self.store.load()
+            actions = {}
+            for k,row in rows.items():
+                action = self._actions.get(k, None)
+                if action is None or self._rows.get(k, None) != row:
+                    action = _action_from_state(row)
+                actions[k] = action
+            self._rows = rows
+            self._actions = actions
+            self._version = version
+            self.generation += 1
+        return self.generation
+
+    def get(self, name:str, refresh:bool=True)->Action|None:
+        if refresh:
+            self.refresh()
+        return self._actions.get(name, None)
+
+    def names(self)->list[str]:
+        self.refresh()
+        return list(self._actions.keys())
+
+    def apply(self, changes:dict[str, dict[str]|None], write:Callable[[], Any]):
+        """Calls `write` to change the table, then applies the same `changes` here (None removes an action) instead of reloading."""
+        with self._lock:
+            before = self.store.version()
+            rtv = write()
+            #if the table changed somewhere else since the last load, the next lookup reloads it instead
+            if before == self._version:
+                for k,row in changes.items():
+                    if row is None:
+                        self._rows.pop(k, None)
+                        self._actions.pop(k, None)
+                    else:
+                        self._rows[k] = row
+                        self._actions[k] = _action_from_state(row)
+                self._version = self.store.version()
+                self.generation += 1
+        return rtv
+
+registry = ActionRegistry(action_store)
+
 def load_action_table(path:str=None)->dict[str, Action]:
-    if path is None:
-        path = ACTIONS_PATH
-    if not os.path.isfile(path):
-        return {}
-    with open(path) as f:
-        d:dict[str,dict[str]] = json.load(f)
-    rtv = {}
-    for k,v in d.items():
-        rtv[k] = action = Action.__new__(Action)
-        action.__setstate__(v)
-    return rtv
+    return {k:_action_from_state(v) for k,v in action_store.load(path).items()}
 
 def save_action_table(table:dict[str, Action], path:str=None):
-    c = json.dumps({action.name:action.__getstate__() for action in table.values()}, indent=4)
-    with open(ACTIONS_PATH if path is None else path, "w") as f:
-        f.write(c)
+    action_store.save({action.name:action.__getstate__() for action in table.values()}, path)
+
+def load_action(name:str, path:str=None)->Action|None:
+    d = action_store.get(name, path)
+    return None if d is None else _action_from_state(d)
+
+def save_action(action:Action, path:str=None):
+    state = action.__getstate__()
+    if registry.covers(path):
+        return registry.apply({action.name:state}, lambda: action_store.put(action.name, state, path))
+    action_store.put(action.name, state, path)
+
+def delete_action(name:str, path:str=None)->bool:
+    if registry.covers(path):
+        return registry.apply({name:None}, lambda: action_store.delete(name, path))
+    return action_store.delete(name, path)
+
+def lookup_action(name:str)->Action|None:
+    """Returns the shared, read-only copy of the action from the registry."""
+    return registry.get(name)
 
 class get_action:
     NO_DEFAULT = object()
@@ -147,27 +313,27 @@ class get_action:
         self.default = default
         self.update = update
         self.path = path
-        self._table = None
+        self._stored = None
         self._action = None
 
     def __enter__(self):
-        self._table = load_action_table(path=self.path)
-        if self.default is self.NO_DEFAULT:
-            self._action = self._table[self.name]
+        self._stored = load_action(self.name, path=self.path)
+        if self._stored is not None:
+            self._action = self._stored
+        elif self.default is self.NO_DEFAULT:
+            raise KeyError(self.name)
         else:
-            self._action = self._table.get(self.name, self.default)
+            self._action = self.default
         return self._action
 
     def __exit__(self, exc_type, exc, tb):
         if self.update and isinstance(self._action, Action):
-            if self._action.name != self.name:
-                if self._action is self._table.get(self.name, None):
-                    del self._table[self.name]
-                self._table[self._action.name] = self._action
-            save_action_table(self._table, path=self.path)
+            if self._action.name != self.name and self._action is self._stored:
+                delete_action(self.name, path=self.path)
+            save_action(self._action, path=self.path)
 
 def check_script(raw:str):
     try:
-        script_runner._prep(raw)
+        script_cache.prepare(raw)
     except tronix.exceptions.TronixException as e:
         return tronix.utils.generate_exception_help(raw, e)
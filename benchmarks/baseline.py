@@ -0,0 +1,38 @@
+"""Loads repository modules as they were before a change, for the benchmarks to compare against.
+
+By default the baseline is the parent of the commit that made the change, found by its "[request_id]" subject prefix.
+Any other git revision can be given instead."""
+import importlib.util
+import os
+import subprocess
+import tempfile
+
+DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def request_commit(request_id:str)->str:
+    """Returns the first commit whose subject starts with `[request_id]`."""
+    prefix = f"[{request_id}]"
+    log = subprocess.check_output(["git", "log", "--reverse", "--format=%H %s"], cwd=DIR, text=True)
+    for line in log.splitlines():
+        commit, _, subject = line.partition(" ")
+        if subject.startswith(prefix):
+            return commit
+    raise LookupError(f"no commit found for {prefix}, pass a baseline revision instead")
+
+def revision_before(request_id:str, revision:str|None=None)->str:
+    return f"{request_commit(request_id)}^" if revision is None else revision
+
+def load_module(filename:str, revision:str, name:str|None=None):
+    """Imports `filename` (relative to the repository root) from `revision`, without replacing the current module."""
+    source = subprocess.check_output(["git", "show", f"{revision}:{filename}"], cwd=DIR, text=True)
+    if name is None:
+        name = "old_" + os.path.splitext(os.path.basename(filename))[0]
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(source)
+    try:
+        spec = importlib.util.spec_from_file_location(name, f.name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.remove(f.name)
+    return module
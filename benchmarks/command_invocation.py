@@ -0,0 +1,86 @@
+"""Measures how many times per second an action command can be invoked, before and after invocation plans.
+
+The old `command_triggers.py` is loaded from a git revision (the one before the change by default).
+Scripts aren't run, so this only measures the work done before an action's script is handed to the script runner.
+Run with `python benchmarks/command_invocation.py [action_count] [revision]` from the repository root."""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import actions
+import baseline
+import command_triggers
+import datafile
+import datastore
+import json
+import timeit
+from twitchio.ext import commands
+
+REQUEST_ID = "user-009"
+COMMAND_NAME = "shoutout"
+
+class NullScriptRunner:
+    def _prep(self, s):
+        return s
+
+    def run_async(self, s):
+        return s
+
+def write_data(tmp:str, action_count:int)->tuple[str, str, str]:
+    actions_path = os.path.join(tmp, "actions.json")
+    commands_path = os.path.join(tmp, "commands.json")
+    triggers_path = os.path.join(tmp, "command_triggers.json")
+    with open(actions_path, "w") as f:
+        json.dump({f"action{i}": {"name": f"action{i}", "script": f"print(\"action {i}\")\n" * 20, "requested_values": {}} for i in range(action_count)}, f)
+    names = [COMMAND_NAME] + [f"command{i}" for i in range(1, action_count)]
+    with open(commands_path, "w") as f:
+        json.dump({name: {
+            "name": name,
+            "description": "Gives a shoutout.",
+            "signature": {"params": [["target", "text"], ["times", "integer"], ["loud", "true|false"]], "defaults": {"times": "1", "loud": "false"}},
+            "permissions": {},
+            "enabled": True
+        } for name in names}, f)
+    with open(triggers_path, "w") as f:
+        json.dump({COMMAND_NAME: {
+            "name": COMMAND_NAME,
+            "action_name": f"action{action_count // 2}",
+            "action_mapping": {"name_map": {"target": "target", "times": "times", "loud": "loud"}, "extra_data": {"source": "chat"}}
+        }}, f)
+    return actions_path, commands_path, triggers_path
+
+def main(action_count:int=300, revision:str|None=None, seconds:float=2.0):
+    old_command_triggers = baseline.load_module("command_triggers.py", baseline.revision_before(REQUEST_ID, revision))
+    actions.script_runner = NullScriptRunner()
+    datastore.use_sqlite(False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        actions_path, commands_path, triggers_path = write_data(tmp, action_count)
+        actions.action_store.json_path = actions_path
+        command_triggers.command_store.json_path = commands_path
+        old_command_triggers.COMMANDS_PATH = commands_path
+
+        old_trigger = old_command_triggers.load_command_triggers(triggers_path)[COMMAND_NAME]
+        new_trigger = command_triggers.load_command_triggers(triggers_path)[COMMAND_NAME]
+        new_trigger.compile()
+
+        #fake context, only its type and bot are used before the script runs
+        ctx = commands.Context.__new__(commands.Context)
+        ctx._bot = None
+        args = (ctx, "someone", "3")
+
+        print(f"{action_count} actions, invocations per second:")
+        for label, trigger in [("reload per call", old_trigger), ("invocation plan", new_trigger)]:
+            number = 1
+            while True:
+                elapsed = timeit.timeit(lambda: trigger.handle(*args), number=number)
+                if elapsed >= seconds / 10:
+                    break
+                number *= 2
+            number = max(1, int(number * seconds / elapsed))
+            elapsed = timeit.timeit(lambda: trigger.handle(*args), number=number)
+            print(f"  {label}: {number/elapsed:12.0f}/s ({elapsed/number*1e6:9.2f} us per call)")
+    datafile.flush()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300, sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,59 @@
+"""Compares allocations per chat message for deepcopied config reads vs shared read-only snapshots.
+
+The old `config.py` is loaded from a git revision (the one before the change by default).
+Run with `python benchmarks/config_read.py [link_count] [revision]` from the repository root."""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import baseline
+import config
+import json
+import tempfile
+import timeit
+import tracemalloc
+
+REQUEST_ID = "user-001"
+
+def make_configs(link_count:int)->dict[str]:
+    return {
+        "Prefix": "!",
+        "Links": {f"link{i}": f"https://example.com/{i}" for i in range(link_count)},
+        "Style": {"text_color": "#ffffff", "fonts": ["Fragment Mono", "monospace"]}
+    }
+
+def chat_message(module, path:str):
+    configs = module.read(path)
+    links = configs["Links"]
+    return set(links.keys())
+
+def measure_peak(f, *args)->int:
+    tracemalloc.start()
+    f(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main(link_count:int=300, revision:str|None=None, number:int=2000):
+    old_config = baseline.load_module("config.py", baseline.revision_before(REQUEST_ID, revision))
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "config.json")
+        with open(path, "w") as f:
+            json.dump(make_configs(link_count), f)
+
+        #warm up the caches
+        chat_message(old_config, path)
+        chat_message(config, path)
+
+        old_peak = measure_peak(chat_message, old_config, path)
+        new_peak = measure_peak(chat_message, config, path)
+        old_time = timeit.timeit(lambda: chat_message(old_config, path), number=number) / number
+        new_time = timeit.timeit(lambda: chat_message(config, path), number=number) / number
+
+    print(f"config with {link_count} links, per chat message:")
+    print(f"  deepcopy read:  peak {old_peak:>8} bytes  {old_time*1e6:9.2f} us")
+    print(f"  snapshot read:  peak {new_peak:>8} bytes  {new_time*1e6:9.2f} us")
+    print(f"  saved {old_peak - new_peak} bytes allocated per message")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300, sys.argv[2] if len(sys.argv) > 2 else None)
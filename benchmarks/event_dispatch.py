@@ -0,0 +1,64 @@
+"""Measures `events.dispatch` latency while one subscriber is stalled in the middle of handling its events.
+
+The stalled subscriber acts like a WebSocket client that stopped reading, so each send blocks for `stall` seconds.
+The old `events.py` is loaded from a git revision (the one before the change by default).
+Run with `python benchmarks/event_dispatch.py [subscribers] [revision]` from the repository root."""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import baseline
+import events
+import statistics
+import threading
+import time
+
+REQUEST_ID = "user-013"
+
+def consume(bucket, stop:threading.Event, stall:float):
+    while not stop.is_set():
+        if not bucket.wait(0.05):
+            continue
+        for event in bucket.dump():
+            if stall:
+                time.sleep(stall)
+
+def measure(module, subscribers:int, dispatches:int, stall:float)->list[float]:
+    container = module.EventBucketContainer()
+    stop = threading.Event()
+    threads = []
+    for i in range(subscribers):
+        bucket = container.new_bucket()
+        t = threading.Thread(target=consume, args=(bucket, stop, stall if i == 0 else 0), daemon=True)
+        t.start()
+        threads.append(t)
+
+    latencies = []
+    try:
+        for i in range(dispatches):
+            event = module.Event("benchmark", {"i": i})
+            start = time.perf_counter()
+            container.dispatch(event)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.001)
+    finally:
+        stop.set()
+    return latencies
+
+def report(label:str, latencies:list[float]):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"  {label}: mean {statistics.fmean(latencies)*1e6:10.1f} us, p50 {p50*1e6:10.1f} us, p99 {p99*1e6:10.1f} us, max {latencies[-1]*1e6:10.1f} us")
+
+def main(subscribers:int=8, revision:str|None=None, dispatches:int=300, stall:float=0.05):
+    old_events = baseline.load_module("events.py", baseline.revision_before(REQUEST_ID, revision))
+    print(f"{subscribers} subscribers, one stalling {stall*1e3:.0f} ms per event, {dispatches} dispatches:")
+    report("lock held while yielding", measure(old_events, subscribers, dispatches, stall))
+    report("swap-buffer dump        ", measure(events, subscribers, dispatches, stall))
+    print(f"{subscribers} subscribers, none stalling:")
+    report("lock held while yielding", measure(old_events, subscribers, dispatches, 0))
+    report("swap-buffer dump        ", measure(events, subscribers, dispatches, 0))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8, sys.argv[2] if len(sys.argv) > 2 else None)
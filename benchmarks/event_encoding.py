@@ -0,0 +1,43 @@
+"""Measures the time spent encoding one dispatched event for every subscriber, before and after serialize-once events.
+
+Each subscriber's bucket is dumped and every event is encoded the way `/api/events` sends it.
+The old `events.py` is loaded from a git revision (the one before the change by default).
+Run with `python benchmarks/event_encoding.py [subscribers] [revision]` from the repository root."""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import baseline
+import events
+import timeit
+
+REQUEST_ID = "user-016"
+
+def state_change_data()->dict:
+    #about the size of a pngbinds:state_change event
+    return {"stack": [{"name": f"state{i}", "images": [f"media/image{i}_{j}.png" for j in range(4)], "duration": 0.25 * i} for i in range(8)], "default_state": "idle"}
+
+def measure(module, subscribers:int, seconds:float)->float:
+    container = module.EventBucketContainer()
+    for _ in range(subscribers):
+        container.new_bucket()
+    data = state_change_data()
+    def run():
+        container.dispatch(module.Event("pngbinds:state_change", data))
+        for bucket in container.buckets.values():
+            for e in bucket.dump():
+                e.to_json()
+    number = 1
+    while (elapsed := timeit.timeit(run, number=number)) < seconds / 10:
+        number *= 2
+    number = max(1, int(number * seconds / elapsed))
+    return timeit.timeit(run, number=number) / number
+
+def main(subscribers:int=16, revision:str|None=None, seconds:float=1.0):
+    old_events = baseline.load_module("events.py", baseline.revision_before(REQUEST_ID, revision))
+    print(f"{subscribers} subscribers, time to dispatch one event and encode it for each of them:")
+    for label, module in [("encode per subscriber", old_events), ("encode once          ", events)]:
+        print(f"  {label}: {measure(module, subscribers, seconds)*1e6:9.2f} us")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16, sys.argv[2] if len(sys.argv) > 2 else None)
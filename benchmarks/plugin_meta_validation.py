@@ -0,0 +1,46 @@
+"""Compares the interpreted config validation from before schema compilation with the compiled validators.
+
+The old implementation is loaded from `plugins.py` at a git revision (the one before the change by default).
+Run with `python benchmarks/plugin_meta_validation.py [sound_count] [revision]` from the repository root."""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import baseline
+import json
+import plugins
+import timeit
+
+DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUEST_ID = "user-005"
+SOUNDREQ_META_FILE = os.path.join(DIR, "plugins", "soundreq", "plugin.json")
+
+def make_configs(sound_count:int)->dict[str]:
+    return {
+        "Prefix": "!",
+        "Sound-Request": {
+            "Sounds": {f"sound{i}": {"file": f"sounds/{i}.mp3", "name": f"Sound {i}" if i % 2 else None} for i in range(sound_count)},
+            "Output-Device": "CABLE Input"
+        }
+    }
+
+def main(sound_count:int=5000, revision:str|None=None, number:int=20):
+    old_plugins = baseline.load_module("plugins.py", baseline.revision_before(REQUEST_ID, revision))
+    with open(SOUNDREQ_META_FILE) as f:
+        meta_data = json.load(f)
+    old_meta = old_plugins.parse_plugin_meta(meta_data)
+    new_meta = plugins.parse_plugin_meta(meta_data)
+    c = make_configs(sound_count)
+
+    assert old_plugins.config_apply_meta(c, old_meta.configs) == new_meta.apply(c)
+
+    old_time = timeit.timeit(lambda: old_plugins.config_apply_meta(c, old_meta.configs), number=number) / number
+    new_time = timeit.timeit(lambda: new_meta.apply(c), number=number) / number
+
+    print(f"Sound-Request config with {sound_count} sounds, per validation:")
+    print(f"  interpreted: {old_time*1e3:9.3f} ms")
+    print(f"  compiled:    {new_time*1e3:9.3f} ms")
+    print(f"  speedup:     {old_time/new_time:9.2f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, sys.argv[2] if len(sys.argv) > 2 else None)
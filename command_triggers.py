@@ -1,8 +1,10 @@
 import actions
+from array import array
 import datafile
+import datastore
 import inspect
-import json
-import os
+import itertools
+import operator
 import twitchio
 import tronix_twitch_integrations as tti
 from tronix import script, utils
@@ -16,6 +18,9 @@ CommandCallback = Callable[..., Any]
 COMMAND_TRIGGERS_PATH = datafile.makepath("command_triggers.json")
 COMMANDS_PATH = datafile.makepath("commands.json")
 
+command_trigger_store = datastore.table("command_triggers", COMMAND_TRIGGERS_PATH)
+command_store = datastore.table("commands", COMMANDS_PATH)
+
 type_names = {
     "str": "text",
     "int": "integer",
@@ -30,6 +35,82 @@ value_names = {
 
 COMMAND_SIGNATURE_STORE_ATTR = "_COMMAND_SIGNATURE_STORE"
 
+_MISSING = object()
+
+class CommandInvocationException(Exception):
+    """Base class for exceptions raised while invoking an action command."""
+
+class CommandNotFoundException(CommandInvocationException):
+    """The command has no command info."""
+
+class UnknownActionException(CommandInvocationException):
+    """The command triggers an action that doesn't exist."""
+
+class InvalidSignatureException(CommandInvocationException):
+    """The command's signature has a required parameter after one with a default, or a default that doesn't convert."""
+
+class CommandArgumentException(CommandInvocationException):
+    """The arguments don't fit the command's signature."""
+
+def _convert_bool(arg)->bool:
+    if isinstance(arg, bool):
+        return arg
+    lowered = str(arg).lower()
+    if lowered in ("true", "yes", "y", "on", "1"):
+        return True
+    if lowered in ("false", "no", "n", "off", "0"):
+        return False
+    raise CommandArgumentException(f"expected true or false, got {arg!r}")
+
+#by annotation name, signatures loaded from the commands file have the names instead of the types
+ARGUMENT_CONVERTERS:dict[str, Callable[[Any], Any]] = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": _convert_bool
+}
+
+def _argument_converter(name:str, t:type|Any)->Callable[[Any], Any]|None:
+    """Returns the function converting an argument for the parameter, or None if it's passed on as it is."""
+    if t is EmptyValue or t == str(EmptyValue):
+        return None
+    convert = ARGUMENT_CONVERTERS.get(t.__name__ if isinstance(t, type) else t, None)
+    if convert is None:
+        def unsupported(arg):
+            raise CommandArgumentException(f"parameter {name!r} has an unsupported type {t!r}")
+        return unsupported
+    def converter(arg):
+        try:
+            return convert(arg)
+        except ValueError as e:
+            raise CommandArgumentException(f"invalid value for {name!r}: {arg!r}") from e
+    return converter
+
+#bit for each permission, and the chatter attribute that grants it
+PERMISSION_BITS:dict[str, tuple[int, str]] = {
+    "requires_admin": (1 << 0, "admin"),
+    "requires_artist": (1 << 1, "artist"),
+    "requires_broadcaster": (1 << 2, "broadcaster"),
+    "requires_founder": (1 << 3, "founder"),
+    "requires_moderator": (1 << 4, "moderator"),
+    "requires_no_audio": (1 << 5, "no_audio"),
+    "requires_no_video": (1 << 6, "no_video"),
+    "requires_prime": (1 << 7, "prime"),
+    "requires_staff": (1 << 8, "staff"),
+    "requires_subscriber": (1 << 9, "subscriber"),
+    "requires_turbo": (1 << 10, "turbo"),
+    "requires_verified": (1 << 11, "_is_verified"),
+    "requires_vip": (1 << 12, "vip")
+}
+
+def badge_mask(author:twitchio.Chatter|twitchio.PartialUser)->int:
+    """Bits of the permissions the chatter has. Compute it once per message and pass it to `meets_requirements`."""
+    mask = 0
+    for bit, attr in PERMISSION_BITS.values():
+        if getattr(author, attr, False):
+            mask |= bit
+    return mask
+
 class CommandPermissions:
     def __init__(self,
                  requires_admin:bool=False, requires_artist:bool=False, requires_broadcaster:bool=False, requires_founder:bool=False,
@@ -49,22 +130,30 @@ class CommandPermissions:
         self.requires_verified = requires_verified
         self.requires_vip = requires_vip
 
-    def meets_requirements(self, author:twitchio.Chatter|twitchio.PartialUser):
-        return not (
-            self.requires_admin and not author.admin or self.requires_artist and not author.artist or
-            self.requires_broadcaster and not author.broadcaster or self.requires_founder and not author.founder or
-            self.requires_moderator and not author.moderator or self.requires_no_audio and not author.no_audio or
-            self.requires_no_video and not author.no_video or self.requires_prime and not author.prime or
-            self.requires_staff and not author.staff or self.requires_subscriber and not author.subscriber or
-            self.requires_turbo and not author.turbo or self.requires_verified and not author._is_verified or
-            self.requires_vip and not author.vip
-        )
+    def __setattr__(self, name:str, value):
+        super().__setattr__(name, value)
+        if name in PERMISSION_BITS:
+            self._update_mask()
+
+    def _update_mask(self):
+        mask = 0
+        for name, (bit, _) in PERMISSION_BITS.items():
+            if getattr(self, name, False):
+                mask |= bit
+        self.mask = mask
+
+    def meets_requirements(self, author:twitchio.Chatter|twitchio.PartialUser|int):
+        """`author` can also be the chatter's `badge_mask`."""
+        if not isinstance(author, int):
+            author = badge_mask(author)
+        return author & self.mask == self.mask
     
     def __getstate__(self):
-        return self.__dict__.copy()
+        return {name:getattr(self, name) for name in PERMISSION_BITS}
     
     def __setstate__(self, d:dict[str, bool]):
-        self.__dict__.update(d)
+        self.__dict__.update({name:bool(d.get(name, False)) for name in PERMISSION_BITS})
+        self._update_mask()
 
 class CommandSignature:
     
@@ -172,10 +261,81 @@ class Command:
         self.permissions = permissions
 
 
+class InvocationPlan:
+    """Everything `ActionCommandTrigger.handle` needs for one command, resolved once when the command is synced."""
+
+    def __init__(self, command:Command|None, action_name:str, action_mapping:actions.CommandActionValueMapping):
+        self.command = command
+        self.action_name = action_name
+        self.problem:str|None = None #why the signature is invalid
+        if command is None:
+            params = []
+            defaults = {}
+        else:
+            params = command.signature.params
+            defaults = command.signature.defaults
+            if not command.signature.is_valid():
+                self.problem = "a required parameter comes after one with a default"
+        self.names = tuple(name for name, _ in params)
+        self.converters = tuple(_argument_converter(name, t) for name, t in params)
+        self.defaults = tuple(self._convert_default(convert, defaults.get(name, _MISSING)) for (name, _), convert in zip(params, self.converters))
+        self.mapped_names = tuple(action_mapping.name_map.get(name, name) for name, _ in params)
+        self.extra_data = action_mapping.extra_data
+        self._action:actions.Action|None = None
+        self._generation:int|None = None
+
+    @property
+    def valid(self)->bool:
+        return self.command is not None and self.problem is None
+
+    def _convert_default(self, convert:Callable[[Any], Any]|None, default):
+        #defaults from the commands file are text, like the arguments
+        if convert is None or default is _MISSING or default is None:
+            return default
+        try:
+            return convert(default)
+        except CommandArgumentException as e:
+            if self.problem is None:
+                self.problem = f"bad default, {e}"
+            return _MISSING
+
+    @property
+    def action(self)->actions.Action|None:
+        generation = actions.registry.refresh()
+        if generation != self._generation:
+            self._action = actions.registry.get(self.action_name, refresh=False)
+            self._generation = generation
+        return self._action
+
+    def fill_values(self, args:tuple)->dict[str]:
+        """Converts the command's arguments, fills in defaults, and maps them to the action's requested values."""
+        if len(args) > len(self.converters):
+            raise CommandArgumentException(f"expected at most {len(self.converters)} arguments, got {len(args)}")
+        filled = {}
+        for name, convert, arg in zip(self.mapped_names, self.converters, args):
+            filled[name] = arg if convert is None else convert(arg)
+        missing = [self.names[i] for i in range(len(args), len(self.defaults)) if self.defaults[i] is _MISSING]
+        if missing:
+            raise CommandArgumentException(f"missing required arguments: {', '.join(missing)}")
+        for i in range(len(args), len(self.defaults)):
+            filled[self.mapped_names[i]] = self.defaults[i]
+        filled.update(self.extra_data)
+        return filled
+
+
 class CommandTrigger:
     def __init__(self, name:str):
         self.name = name
 
+    def command_info(self)->Command|None:
+        """The command's description, signature and permissions, or None if it has none."""
+        raise NotImplementedError
+
+    def permissions_mask(self)->int|None:
+        """Bits of the permissions needed to use the command, or None if it has no command info."""
+        cmd = self.command_info()
+        return None if cmd is None else cmd.permissions.mask
+
     def handle(self, *args):
         raise NotImplementedError
     
@@ -183,11 +343,16 @@ class CommandTrigger:
         raise NotImplementedError
 
 
+def _annotation_of(t:type|Any)->str:
+    #same expressions the command callbacks used to be generated with, twitchio evaluates them in this module
+    return t.__name__ if isinstance(t, type) else t if isinstance(t, str) else repr((tt:=type(t)).__new__(tt))
+
 class ActionCommandTrigger(CommandTrigger):
     def __init__(self, name:str, action_name:str, action_mapping:actions.CommandActionValueMapping):
         super().__init__(name)
         self.action_name = action_name
         self.action_mapping = action_mapping
+        self._plan:InvocationPlan|None = None
 
     def __getstate__(self)->dict[str]:
         return {
@@ -202,21 +367,38 @@ class ActionCommandTrigger(CommandTrigger):
         action_mapping = actions.CommandActionValueMapping.__new__(actions.CommandActionValueMapping)
         action_mapping.__setstate__(d["action_mapping"])
         self.action_mapping = action_mapping
+        self._plan = None
 
     def update(self, other:"ActionCommandTrigger"):
         self.name = other.name
         self.action_name = other.action_name
-        self.action_mapping.__setstate__(other.action_mapping.__getstate__())
+        self.action_mapping = other.action_mapping
+        self._plan = None
+
+    def command_info(self)->Command|None:
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        return plan.command
+
+    def compile(self, command:Command|None=_MISSING)->InvocationPlan:
+        """Builds the invocation plan from the command's info, which is loaded if it isn't given."""
+        if command is _MISSING:
+            command = load_command(self.name)
+        self._plan = InvocationPlan(command, self.action_name, self.action_mapping)
+        return self._plan
 
     def handle(self, *args):
-        action = actions.load_action_table().get(self.action_name, None)
-        command = load_commands().get(self.name, None)
-        if command is None:
-            ... #TODO exception could not find command info
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        action = plan.action
+        if plan.command is None:
+            raise CommandNotFoundException(f"no command info for {self.name!r}")
         elif action is None:
-            ... #TODO exception unknown action
-        elif not command.signature.is_valid():
-            ... #TODO exception invalid signature
+            raise UnknownActionException(f"command {self.name!r} triggers unknown action {self.action_name!r}")
+        elif not plan.valid:
+            raise InvalidSignatureException(f"command {self.name!r} has an invalid signature: {plan.problem}")
 
         script_scope = {}
         if args and isinstance(args[0], commands.Context):
@@ -224,36 +406,21 @@ class ActionCommandTrigger(CommandTrigger):
             script_scope[tti.TWITCH_CONTEXT_VAR_NAME] = script.ScriptVariable(utils.wrap_python_value(tti.BotScriptContext(ctx.bot, command_ctx=ctx)))
             args = args[1:]
 
-        if len(args) == len(command.signature.params):
-            filled_args = [t(arg) if isinstance(t, type) else arg for (_, t), arg in zip(command.signature.params, args)]
-        elif len(args) < len(command.signature.params):
-            filled_args = [t(arg) if isinstance(t, type) else arg for (_, t), arg in zip(command.signature.params, args)]
-            for name in (command.signature.params[i][0] for i in range(len(args), len(command.signature.params))):
-                if name in command.signature.defaults:
-                    filled_args.append(command.signature.defaults[name])
-                else:
-                    ... #TODO exception missing required arguments
-        else:
-            ... #TODO exception too many arguments
-
-        filled = self.action_mapping.fill_values({n:v for (n,_), v in zip(command.signature.params, filled_args)})
-        script_scope.update(action.collect_script_values(filled))
-        s = script.Script(action.script, script_scope)
-        return actions.script_runner.run_async(s)
+        script_scope.update(action.collect_script_values(plan.fill_values(args)))
+        return actions.script_runner.run_async(actions.script_cache.get(action.script, script_scope))
     
     def to_twitch_command(self):
-        command = load_commands().get(self.name, None)
+        command = self.compile().command
         if command is None:
-            ... #TODO exception could not find command info
-        check = globals()
-        _sig_p:list[str] = []
+            raise CommandNotFoundException(f"no command info for {self.name!r}")
+        #twitchio reads the parameters from the callback's signature, so no function has to be generated per command
+        params = [inspect.Parameter("ctx", inspect.Parameter.POSITIONAL_OR_KEYWORD)]
         for (n, t) in command.signature.params:
-            _sig_p.append(f"{n}:{t.__name__ if isinstance(t, type) else t if isinstance(t, str) else repr((tt:=type(t)).__new__(tt))}")
-        _sig_s:str = ",".join(_sig_p)
-        exec(f"def _callback(ctx,{_sig_s}): pass", check)
-        cb = check["_callback"]
-        cb.__name__ = cb.__qualname__ = f"_callback_{self.name}"
-        cmd = commands.Command(name=self.name, callback=cb)
+            params.append(inspect.Parameter(n, inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=_annotation_of(t)))
+        def _callback(*args): pass
+        _callback.__signature__ = inspect.Signature(params)
+        _callback.__name__ = _callback.__qualname__ = f"_callback_{self.name}"
+        cmd = commands.Command(name=self.name, callback=_callback)
         cmd._callback = self.handle
         return cmd
 
@@ -292,6 +459,9 @@ class CallbackCommandTrigger(CommandTrigger):
         self.permissions = permissions
         self.callback = callback
         self.bind = bind
+
+    def command_info(self)->Command|None:
+        return self.generate_command()
     
     def handle(self, *args, **kwargs):
         if not self.signature.is_valid():
@@ -314,38 +484,85 @@ class CallbackCommandTrigger(CommandTrigger):
         return self.handle(*args, **kwargs)
     
 
+class HelpIndex:
+    """Precomputed help text for a set of command triggers. Build a new one when the set of commands changes.
+
+    Command listings are cached per permission tier, which is the part of a chatter's `badge_mask` that any command requires."""
+
+    def __init__(self, triggers:dict[str, CommandTrigger], prefix:str="!"):
+        self.names:list[str] = []
+        self.masks = array("Q")
+        self.usages:dict[str, tuple[int, str]] = {}
+        self.used_bits = 0
+        self._listings:dict[int, str] = {}
+        for name, ct in triggers.items():
+            cmd = ct.command_info()
+            if cmd is None:
+                continue
+            mask = cmd.permissions.mask
+            self.names.append(name)
+            self.masks.append(mask)
+            self.used_bits |= mask
+            r = []
+            if cmd.description:
+                r.append(cmd.description)
+            r.append(f"Usage: {cmd.signature.generate_str(prefix, name)}")
+            self.usages[name] = mask, " ".join(r)
+
+    def allowed(self, author_mask:int)->list[str]:
+        """Names of the commands a chatter with the mask can use, in the order they were added."""
+        #a command is allowed when it needs no bits the chatter doesn't have
+        return list(itertools.compress(self.names, map(operator.not_, map((~author_mask).__and__, self.masks))))
+
+    def listing(self, author_mask:int)->str:
+        tier = author_mask & self.used_bits
+        text = self._listings.get(tier, None)
+        if text is None:
+            self._listings[tier] = text = "Commands: " + ", ".join(self.allowed(tier))
+        return text
+
+    def usage(self, name:str)->tuple[int, str]|None:
+        """The permissions mask and help text of the command, or None if it has no command info."""
+        return self.usages.get(name, None)
+
+def _command_trigger_from_state(d:dict[str])->ActionCommandTrigger:
+    cmd = ActionCommandTrigger.__new__(ActionCommandTrigger)
+    cmd.__setstate__(d)
+    return cmd
+
+def _command_from_state(d:dict[str])->Command:
+    cmd = Command.__new__(Command)
+    cmd.__setstate__(d)
+    return cmd
+
 def load_command_triggers(path:str=None)->dict[str, ActionCommandTrigger]:
-    if path is None:
-        path = COMMAND_TRIGGERS_PATH
-    if not os.path.isfile(path):
-        return {}
-    with open(path) as f:
-        d:dict[str,dict[str]] = json.load(f)
-    rtv = {}
-    for k,v in d.items():
-        rtv[k] = cmd = ActionCommandTrigger.__new__(ActionCommandTrigger)
-        cmd.__setstate__(v)
-    return rtv
+    return {k:_command_trigger_from_state(v) for k,v in command_trigger_store.load(path).items()}
 
 def save_command_triggers(commands:dict[str, ActionCommandTrigger], path:str=None):
-    c = json.dumps({c.name:c.__getstate__() for c in commands.values() if isinstance(c, ActionCommandTrigger)}, indent=4)
-    with open(COMMAND_TRIGGERS_PATH if path is None else path, "w") as f:
-        f.write(c)
+    command_trigger_store.save({c.name:c.__getstate__() for c in commands.values() if isinstance(c, ActionCommandTrigger)}, path)
+
+def load_command_trigger(name:str, path:str=None)->ActionCommandTrigger|None:
+    d = command_trigger_store.get(name, path)
+    return None if d is None else _command_trigger_from_state(d)
+
+def save_command_trigger(trigger:ActionCommandTrigger, path:str=None):
+    command_trigger_store.put(trigger.name, trigger.__getstate__(), path)
+
+def delete_command_trigger(name:str, path:str=None)->bool:
+    return command_trigger_store.delete(name, path)
 
 def load_commands(path:str=None)->dict[str, Command]:
-    if path is None:
-        path = COMMANDS_PATH
-    if not os.path.isfile(path):
-        return {}
-    with open(path) as f:
-        d:dict[str,dict[str]] = json.load(f)
-    rtv = {}
-    for k,v in d.items():
-        rtv[k] = cmd = Command.__new__(Command)
-        cmd.__setstate__(v)
-    return rtv
+    return {k:_command_from_state(v) for k,v in command_store.load(path).items()}
 
 def save_commands(commands:dict[str, Command], path:str=None):
-    c = json.dumps({c.name:c.__getstate__() for c in commands.values() if isinstance(c, Command)}, indent=4)
-    with open(COMMANDS_PATH if path is None else path, "w") as f:
-        f.write(c)
\ No newline at end of file
+    command_store.save({c.name:c.__getstate__() for c in commands.values() if isinstance(c, Command)}, path)
+
+def load_command(name:str, path:str=None)->Command|None:
+    d = command_store.get(name, path)
+    return None if d is None else _command_from_state(d)
+
+def save_command(command:Command, path:str=None):
+    command_store.put(command.name, command.__getstate__(), path)
+
+def delete_command(name:str, path:str=None)->bool:
+    return command_store.delete(name, path)
\ No newline at end of file
@@ -1,66 +1,427 @@
-import copy
+import ctypes
+import ctypes.util
 import datafile
-from datetime import datetime
+import events
+import hashlib
+import itertools
 import json
 import os
-from typing import Any
+import select
+import struct
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable
 
 DEFAULT_CONFIG_FILE = CONFIG_FILE = datafile.makepath("config.json")
 PLUGIN_FILE = datafile.makepath("plugins.json")
 OAUTH_TWITCH_FILE = datafile.makepath("oauth_twitch.json")
 
-_cached_contents:dict[str, tuple[datetime, Any]] = {}
+EVENT_CONFIG_CHANGED = "config:changed"
+DEFAULT_POLL_INTERVAL = 1.0
 
-def read(path:str=None, use_cache:bool=True)->dict[str]:
+class FrozenDict(dict):
+    """Read-only dict shared between all readers of a config file. Use `edit` or `thaw` to get a mutable copy."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only, use config.edit() or config.thaw() to make changes")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+class FrozenList(list):
+    """Read-only list shared between all readers of a config file. Use `edit` or `thaw` to get a mutable copy."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only, use config.edit() or config.thaw() to make changes")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+def freeze(value:Any):
+    """Recursively converts parsed json data into read-only containers."""
+    if isinstance(value, dict):
+        return value if type(value) is FrozenDict else FrozenDict((k, freeze(v)) for k,v in value.items())
+    elif isinstance(value, list):
+        return value if type(value) is FrozenList else FrozenList(freeze(v) for v in value)
+    return value
+
+def thaw(value:Any):
+    """Recursively copies (frozen) json data into plain, mutable containers."""
+    if isinstance(value, dict):
+        return {k:thaw(v) for k,v in value.items()}
+    elif isinstance(value, list):
+        return [thaw(v) for v in value]
+    return value
+
+class Snapshot:
+    """Parsed contents of a config file at a specific version."""
+    def __init__(self, path:str, version:int, stat_key:tuple[int, int, int]|None, contents:FrozenDict):
+        self.path = path
+        self.version = version
+        self.stat_key = stat_key
+        self.contents = contents
+
+_snapshots:dict[str, Snapshot] = {}
+_snapshots_lock = threading.Lock()
+_version_counter = itertools.count(1)
+
+def _stat_key(path:str)->tuple[int, int, int]|None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+def _parse(path:str)->FrozenDict:
+    text = datafile.read_text(path)
+    if text is None:
+        return FrozenDict()
+    return freeze(json.loads(text))
+
+def refresh(path:str=None)->Snapshot:
+    """Stats the config file and re-parses it if it changed since the last snapshot. Publishes a change event if there is a watcher."""
     if path is None:
         path = CONFIG_FILE
-    if os.path.isfile(path):
-        mtime = datetime.fromtimestamp(os.path.getmtime(path))
+    old = _snapshots.get(path, None)
+    if old is not None and datafile.writer.is_pending(path):
+        return old #the snapshot was set by write() and is newer than the file
+    key = _stat_key(path)
+    if old is not None and old.stat_key == key:
+        return old
+    with _snapshots_lock:
+        old = _snapshots.get(path, None)
+        if old is not None and old.stat_key == key:
+            return old
+        snapshot = _snapshots[path] = Snapshot(path, next(_version_counter), key, _parse(path))
+    if old is not None and watcher is not None:
+        watcher.publish(snapshot)
+    return snapshot
 
-        if use_cache and path in _cached_contents:
-            cachetime, contents = _cached_contents[path]
-            if mtime == cachetime:
-                return copy.deepcopy(contents)
+def _set_snapshot(path:str, contents:FrozenDict)->Snapshot:
+    with _snapshots_lock:
+        old = _snapshots.get(path, None)
+        snapshot = _snapshots[path] = Snapshot(path, next(_version_counter), None if old is None else old.stat_key, contents)
+    if old is not None and watcher is not None:
+        watcher.publish(snapshot)
+    return snapshot
 
-        with open(path) as f:
-            contents = json.load(f)
-        
-        if use_cache:
-            _cached_contents[path] = mtime, copy.deepcopy(contents)
+def _written(snapshot:Snapshot):
+    #the file now matches the snapshot, so the watcher shouldn't re-parse it
+    if _snapshots.get(snapshot.path, None) is snapshot:
+        snapshot.stat_key = _stat_key(snapshot.path)
 
-        return contents
-    else:
-        return {}
+def get_snapshot(path:str=None)->Snapshot:
+    """Returns the current snapshot of the config file. While the watcher is running this is a dict lookup with no syscalls."""
+    if path is None:
+        path = CONFIG_FILE
+    if watcher is not None and watcher.running:
+        snapshot = _snapshots.get(path, None)
+        if snapshot is None or path not in watcher.paths:
+            watcher.watch(path)
+            snapshot = refresh(path)
+        return snapshot
+    return refresh(path)
+
+def version(path:str=None)->int:
+    """Returns the version of the current snapshot. Versions only ever increase, and change every time a file is re-parsed."""
+    return get_snapshot(path).version
+
+def read(path:str=None, use_cache:bool=True)->FrozenDict:
+    """Returns a read-only snapshot of the config file. Snapshots are shared, so they are never copied."""
+    if path is None:
+        path = CONFIG_FILE
+    if use_cache:
+        return get_snapshot(path).contents
+    return _parse(path)
 
 def write(new_configs:dict[str]|None=None, config_updates:dict[str]|None=None, path:str=None, use_cache:bool=True):
+    """Replaces and/or updates the contents of the config file. Readers see the change immediately, the file is written in the background."""
     if path is None:
         path = CONFIG_FILE
-    if os.path.isfile(path):
-        with open(path, "r+") as f:
-            contents = f.read()
-            configs:dict[str] = new_configs if new_configs is not None else json.loads(contents)
-            if config_updates is not None:
-                configs = {**configs, **config_updates}
-            f.seek(0)
-            f.truncate()
-            try:
-                json.dump(configs, f, indent=4)
-            except:
-                f.write(contents)
-                raise
-    elif new_configs:
-        if config_updates:
-            d = {**new_configs, **config_updates}
-        else:
-            d = new_configs
-        with open(path, "w") as f:
-            json.dump(d, f, indent=4)
-    elif config_updates:
-        with open(path, "w") as f:
-            json.dump(config_updates, f, indent=4)
+    if new_configs is None:
+        text = datafile.read_text(path)
+        configs:dict[str] = {} if text is None else json.loads(text)
+    else:
+        configs = new_configs
+    if config_updates is not None:
+        configs = {**configs, **config_updates}
+    text = json.dumps(configs, indent=4)
+
+    if use_cache:
+        snapshot = _set_snapshot(path, freeze(configs))
+        datafile.write_text(path, text, lambda: _written(snapshot))
     else:
-        with open(path, "w") as f:
-            f.write("{}")
+        datafile.write_text(path, text)
+
+class edit:
+    """Context manager for changing a config file. Yields a mutable copy of the contents, which is written back on exit."""
+
+    def __init__(self, path:str=None, use_cache:bool=True):
+        self.path = CONFIG_FILE if path is None else path
+        self.use_cache = use_cache
+        self._contents = None
+
+    def __enter__(self)->dict[str]:
+        self._contents = thaw(read(self.path, self.use_cache))
+        return self._contents
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            write(self._contents, path=self.path, use_cache=self.use_cache)
+
+
+def _content_hash(value:Any)->bytes:
+    return hashlib.blake2b(json.dumps(value, sort_keys=True).encode("utf-8"), digest_size=16).digest()
+
+class Section:
+    """One top-level section of a config file. Its version only changes when the section's contents change, not when other parts of the file do."""
+
+    def __init__(self, name:str, path:str|None=None):
+        self.name = name
+        self.path = path
+        self._version = 0
+        self._file_version:int|None = None
+        self._hash:bytes|None = None
+        self._value:Any = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        snapshot = get_snapshot(self.path)
+        if snapshot.version == self._file_version:
+            return
+        with self._lock:
+            if snapshot.version == self._file_version:
+                return
+            contents = snapshot.contents
+            value = contents.get(self.name, None) if isinstance(contents, dict) else None
+            h = _content_hash(value)
+            if h != self._hash:
+                self._hash = h
+                self._value = value
+                self._version += 1
+            self._file_version = snapshot.version
+
+    @property
+    def version(self)->int:
+        self._refresh()
+        return self._version
+
+    def get(self)->Any:
+        """Returns the read-only contents of the section, or None if the file doesn't have it."""
+        self._refresh()
+        return self._value
+
+    def derive(self, compute:Callable[[Any], Any])->"DerivedValue":
+        return DerivedValue(self, compute)
+
+class DerivedValue:
+    """Value computed from a section, which is only recomputed when the section's version changes."""
+
+    def __init__(self, section:Section, compute:Callable[[Any], Any]):
+        self.section = section
+        self.compute = compute
+        self._version:int|None = None
+        self._value:Any = None
+
+    def get(self)->Any:
+        version = self.section.version
+        if version != self._version:
+            self._value = self.compute(self.section.get())
+            self._version = version
+        return self._value
+
+    def invalidate(self):
+        self._version = None
+
+_sections:dict[tuple[str|None, str], Section] = {}
+
+def section(name:str, path:str|None=None)->Section:
+    """Returns the shared accessor for a top-level section. A path of None always refers to the current CONFIG_FILE."""
+    key = path, name
+    s = _sections.get(key, None)
+    if s is None:
+        s = _sections.setdefault(key, Section(name, path))
+    return s
+
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+def _inotify_init()->tuple[ctypes.CDLL, int]|None:
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    return libc, fd
+
+class ConfigWatcher:
+    """Keeps the snapshots of watched config files up to date in the background.
+
+    Uses inotify on Linux, and falls back to polling the files' stats everywhere else.
+    Changes are published as `config:changed` events to `container` (event sockets) and `collection` (local listeners)."""
+
+    def __init__(self, poll_interval:float=DEFAULT_POLL_INTERVAL, container:events.EventBucketContainer|None=events.default_container,
+                 collection:events.EventListenerCollection|None=events.default_listeners, use_inotify:bool=True):
+        self.poll_interval = poll_interval
+        self.container = container
+        self.collection = collection
+        self.use_inotify = use_inotify
+        self.paths:set[str] = set()
+        self.running = False
+        self._dirs:dict[str, int] = {}
+        self._dir_paths:dict[int, set[str]] = {}
+        self._inotify:tuple[ctypes.CDLL, int]|None = None
+        self._thread:threading.Thread|None = None
+        self._lock = threading.Lock()
+
+    @property
+    def uses_inotify(self)->bool:
+        return self._inotify is not None
+
+    def watch(self, path:str):
+        with self._lock:
+            self.paths.add(path)
+            if self._inotify is not None:
+                directory = os.path.dirname(os.path.abspath(path))
+                wd = self._dirs.get(directory, None)
+                if wd is None:
+                    libc, fd = self._inotify
+                    wd = libc.inotify_add_watch(fd, os.fsencode(directory), _IN_WATCH_MASK)
+                    if wd < 0:
+                        print(f"config watcher: could not watch {directory} (errno {ctypes.get_errno()}), polling it instead")
+                        return
+                    self._dirs[directory] = wd
+                self._dir_paths.setdefault(wd, set()).add(path)
+
+    def unwatch(self, path:str):
+        with self._lock:
+            self.paths.discard(path)
+            for paths in self._dir_paths.values():
+                paths.discard(path)
+
+    def check(self, path:str):
+        try:
+            refresh(path)
+        except (OSError, ValueError) as e:
+            #keep the last good snapshot (e.g. the file is mid-write)
+            print(f"config watcher: failed to reload {path}:")
+            traceback.print_exception(e)
+
+    def publish(self, snapshot:Snapshot):
+        event = events.Event(EVENT_CONFIG_CHANGED, {"path": snapshot.path, "version": snapshot.version}, key=f"{EVENT_CONFIG_CHANGED}:{snapshot.path}")
+        if self.container is not None:
+            self.container.dispatch(event)
+        if self.collection is not None:
+            self.collection.handle_event(event)
+
+    def start(self):
+        if self.running:
+            return
+        if self.use_inotify:
+            self._inotify = _inotify_init()
+        self.running = True
+        for path in list(self.paths):
+            self.watch(path)
+            self.check(path)
+        self._thread = threading.Thread(target=self._run_inotify if self._inotify is not None else self._run_polling, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(self.poll_interval * 2)
+            self._thread = None
+        if self._inotify is not None:
+            os.close(self._inotify[1])
+            self._inotify = None
+        self._dirs.clear()
+        self._dir_paths.clear()
+
+    def _run_polling(self):
+        while self.running:
+            with self._lock:
+                paths = list(self.paths)
+            for path in paths:
+                self.check(path)
+            time.sleep(self.poll_interval)
+
+    def _run_inotify(self):
+        fd = self._inotify[1]
+        while self.running:
+            r, _, _ = select.select([fd], [], [], self.poll_interval)
+            #paths whose directories could not be watched still get polled
+            with self._lock:
+                unmapped = self.paths.difference(*self._dir_paths.values())
+            for path in unmapped:
+                self.check(path)
+            if not r:
+                continue
+            try:
+                data = os.read(fd, 16384)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                return
+            changed:set[str] = set()
+            offset = 0
+            while offset < len(data):
+                wd, _, _, namelen = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset+namelen].rstrip(b"\0"))
+                offset += namelen
+                with self._lock:
+                    for path in self._dir_paths.get(wd, ()):
+                        if os.path.basename(path) == name:
+                            changed.add(path)
+            for path in changed:
+                self.check(path)
+
+watcher:ConfigWatcher|None = None
+
+def start_watcher(poll_interval:float=DEFAULT_POLL_INTERVAL, container:events.EventBucketContainer|None=events.default_container,
+                  collection:events.EventListenerCollection|None=events.default_listeners, use_inotify:bool=True)->ConfigWatcher:
+    """Starts watching every config file that has been or will be read."""
+    global watcher
+    if watcher is not None:
+        watcher.stop()
+    watcher = ConfigWatcher(poll_interval, container, collection, use_inotify)
+    watcher.paths.update(_snapshots.keys())
+    watcher.start()
+    return watcher
 
-    if use_cache and path in _cached_contents:
-        _cached_contents.pop(path)
\ No newline at end of file
+def stop_watcher():
+    global watcher
+    if watcher is not None:
+        old = watcher
+        watcher = None
+        old.stop()
@@ -1,7 +1,197 @@
+import atexit
 import os
+import tempfile
+import threading
+import time
+import traceback
+from typing import Callable
 
 DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(DIR, "data")
 
+DEFAULT_WRITE_DELAY = 0.25
+DEFAULT_FSYNC_INTERVAL = 5.0
+
+FlushedCallback = Callable[[], None]
+
+def _get_umask()->int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+#new files get the mode open() would give them, existing files keep theirs
+NEW_FILE_MODE = 0o666 & ~_get_umask()
+
 def makepath(*paths:str, dir:str=None):
     return os.path.join(DATA_DIR if dir is None else dir, *paths)
+
+def write_atomic(path:str, text:str, fsync:bool=True):
+    """Writes the file by renaming a finished temp file over it, so it is never left half-written."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        #mkstemp creates the file as 0600
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class PendingWrite:
+    def __init__(self, text:str, due:float, on_flushed:list[FlushedCallback]):
+        self.text = text
+        self.due = due
+        self.on_flushed = on_flushed
+
+class WriteBehindWriter:
+    """Writes data files in the background.
+
+    Writes to the same file within `delay` seconds of each other are coalesced, so only the newest contents get written.
+    Files are only fsynced if `fsync_interval` seconds have passed since the last fsync (0 fsyncs every write, None never does).
+    Failed writes are retried in the background, `error` returns why the last write of a file's newest contents failed."""
+
+    def __init__(self, delay:float=DEFAULT_WRITE_DELAY, fsync_interval:float|None=DEFAULT_FSYNC_INTERVAL):
+        self.delay = delay
+        self.fsync_interval = fsync_interval
+        self.pending:dict[str, PendingWrite] = {}
+        self.errors:dict[str, OSError] = {}
+        self.last_fsync = 0.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread:threading.Thread|None = None
+
+    def write(self, path:str, text:str, on_flushed:FlushedCallback|None=None):
+        """Queues the new contents of the file. `on_flushed` is called once the contents are on disk."""
+        key = os.path.abspath(path)
+        with self._cond:
+            #errors are about the contents being written, new contents get a new try
+            self.errors.pop(key, None)
+            p = self.pending.get(key, None)
+            if p is None:
+                self.pending[key] = PendingWrite(text, time.monotonic() + self.delay, [] if on_flushed is None else [on_flushed])
+            else:
+                p.text = text
+                if on_flushed is not None:
+                    p.on_flushed.append(on_flushed)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def read(self, path:str)->str|None:
+        """Returns the newest contents of the file, including writes that are still queued, or None if it doesn't exist."""
+        p = self.pending.get(os.path.abspath(path), None)
+        if p is not None:
+            return p.text
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def is_pending(self, path:str)->bool:
+        return os.path.abspath(path) in self.pending
+
+    def error(self, path:str)->OSError|None:
+        return self.errors.get(os.path.abspath(path), None)
+
+    def status(self, path:str)->dict[str]:
+        """Whether the file still has queued contents, and why its last write failed (None if it hasn't)."""
+        e = self.error(path)
+        return {"pending": self.is_pending(path), "error": None if e is None else str(e)}
+
+    def flush(self, path:str|None=None, raise_errors:bool=False):
+        """Writes queued contents immediately, for one file or for all of them.
+
+        With `raise_errors`, raises the first OSError once every file has been tried, instead of leaving it to be retried."""
+        if path is None:
+            keys = list(self.pending.keys())
+        else:
+            keys = [os.path.abspath(path)]
+        error = None
+        for key in keys:
+            e = self._flush(key)
+            if error is None:
+                error = e
+        if raise_errors and error is not None:
+            raise error
+
+    def _flush(self, key:str)->OSError|None:
+        with self._flush_lock:
+            with self._cond:
+                p = self.pending.get(key, None)
+                if p is None:
+                    return None
+                text = p.text
+            now = time.monotonic()
+            fsync = self.fsync_interval is not None and now - self.last_fsync >= self.fsync_interval
+            try:
+                write_atomic(key, text, fsync)
+            except OSError as e:
+                print(f"failed to write {key}, retrying later:")
+                traceback.print_exception(e)
+                p.due = now + max(self.delay, 1.0)
+                with self._cond:
+                    if p.text is text:
+                        self.errors[key] = e
+                return e
+            if fsync:
+                self.last_fsync = now
+            with self._cond:
+                self.errors.pop(key, None)
+                #newer contents may have been queued while writing
+                if p.text is text:
+                    callbacks = p.on_flushed
+                    p.on_flushed = []
+                else:
+                    callbacks = []
+            try:
+                for callback in callbacks:
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"error in callback after writing {key}:")
+                        traceback.print_exception(e)
+            finally:
+                with self._cond:
+                    #only stop reporting as pending once the callbacks have run
+                    if self.pending.get(key, None) is p and p.text is text:
+                        del self.pending[key]
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [key for key, p in self.pending.items() if p.due <= now]
+                if not due:
+                    self._cond.wait(min(p.due for p in self.pending.values()) - now)
+                    continue
+            for key in due:
+                self._flush(key)
+
+writer = WriteBehindWriter()
+atexit.register(writer.flush)
+
+def write_text(path:str, text:str, on_flushed:FlushedCallback|None=None):
+    return writer.write(path, text, on_flushed)
+
+def read_text(path:str)->str|None:
+    return writer.read(path)
+
+def status(path:str)->dict[str]:
+    return writer.status(path)
+
+def flush(path:str|None=None, raise_errors:bool=False):
+    return writer.flush(path, raise_errors)
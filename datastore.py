@@ -0,0 +1,257 @@
+import argparse
+import config
+import datafile
+import events
+import importlib
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Hashable
+
+DIR = os.path.dirname(__file__)
+DB_PATH = datafile.makepath("data.sqlite3")
+
+#modules that create tables when imported, so import/export can find all of them
+TABLE_MODULES = ["actions", "command_triggers", "rewards", os.path.join(DIR, "plugins", "pngbinds", "medialist.py")]
+
+EVENT_DATA_CHANGED = "data:changed"
+
+Row = dict[str, Any]
+
+_local = threading.local()
+_sqlite_enabled:bool|None = None
+
+def sqlite_enabled()->bool:
+    """The SQLite store is used once its database file exists, otherwise everything stays in the JSON files."""
+    global _sqlite_enabled
+    if _sqlite_enabled is None:
+        _sqlite_enabled = os.path.isfile(DB_PATH)
+    return _sqlite_enabled
+
+def use_sqlite(enabled:bool=True):
+    global _sqlite_enabled
+    _sqlite_enabled = enabled
+
+def diff_rows(old:dict[str, Row], new:dict[str, Row])->tuple[list[str], list[str], list[str]]:
+    """Returns the added, removed and modified keys."""
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    modified = [k for k,v in new.items() if k in old and old[k] != v]
+    return added, removed, modified
+
+def publish(table:str, added:list[str]=(), removed:list[str]=(), modified:list[str]=(), remote:bool=False):
+    """Tells listeners which rows of the table changed. `remote` also sends it over the events socket."""
+    if not (added or removed or modified):
+        return
+    event = events.Event(EVENT_DATA_CHANGED, {"table": table, "added": list(added), "removed": list(removed), "modified": list(modified)})
+    events.handle_event(event)
+    if remote:
+        events.dispatch(event)
+
+def connect()->sqlite3.Connection:
+    """Returns this thread's connection to the database."""
+    conn:sqlite3.Connection|None = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+class Table:
+    """Rows of one data file, keyed by name.
+
+    Rows are the `__getstate__` dicts of whatever the file holds. With the SQLite store each row is its own record,
+    so single-row changes don't rewrite the rest of the table. Other paths than `json_path` always use JSON files.
+
+    Writes to the table publish `EVENT_DATA_CHANGED` with the keys that changed. SQLite writes are visible to other
+    processes right away, so they're also sent over the events socket. JSON files may not be written yet, so other
+    processes find out about those through `watch` instead."""
+
+    def __init__(self, name:str, json_path:str):
+        self.name = name
+        self.json_path = json_path
+        self._created = False
+        self._writes = 0
+        self._watched:config.Snapshot|None = None
+
+    def is_default(self, path:str|None)->bool:
+        return path is None or os.path.abspath(path) == os.path.abspath(self.json_path)
+
+    def uses_sqlite(self, path:str|None=None)->bool:
+        return sqlite_enabled() and self.is_default(path)
+
+    def _publish(self, path:str|None, added:list[str]=(), removed:list[str]=(), modified:list[str]=()):
+        if self.is_default(path):
+            publish(self.name, added, removed, modified, remote=self.uses_sqlite(path))
+
+    def watch(self):
+        """Publishes changes made to the JSON file outside of this process, using the config watcher to notice them."""
+        if self.uses_sqlite() or self._watched is not None:
+            return
+        self._watched = config.get_snapshot(self.json_path)
+        events.add_listener(config.EVENT_CONFIG_CHANGED, self._on_file_changed)
+
+    def _on_file_changed(self, event:events.Event):
+        if event.data.get("path", None) != self.json_path:
+            return
+        snapshot = config.get_snapshot(self.json_path)
+        old = self._watched
+        if old is None or snapshot.version == old.version:
+            return
+        self._watched = snapshot
+        publish(self.name, *diff_rows(old.contents, snapshot.contents))
+
+    def _connect(self)->sqlite3.Connection:
+        conn = connect()
+        if not self._created:
+            with conn:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.name}" (name TEXT PRIMARY KEY, data TEXT NOT NULL)')
+                conn.execute('CREATE TABLE IF NOT EXISTS "_versions" (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            self._created = True
+        return conn
+
+    def _bump(self, conn:sqlite3.Connection):
+        conn.execute('INSERT INTO "_versions" (name, version) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1', (self.name,))
+
+    def version(self)->Hashable:
+        """Changes whenever the table is written, by this process or by another one."""
+        if not self.uses_sqlite():
+            if datafile.writer.is_pending(self.json_path):
+                return self._writes, None
+            try:
+                st = os.stat(self.json_path)
+            except FileNotFoundError:
+                return self._writes, None
+            return self._writes, st.st_mtime_ns, st.st_size, st.st_ino
+        r = self._connect().execute('SELECT version FROM "_versions" WHERE name = ?', (self.name,)).fetchone()
+        return 0 if r is None else r[0]
+
+    def _read_json(self, path:str|None)->dict[str, Row]:
+        text = datafile.read_text(self.json_path if path is None else path)
+        if text is None:
+            return {}
+        return json.loads(text)
+
+    def _write_json(self, rows:dict[str, Row], path:str|None):
+        self._writes += 1
+        datafile.write_text(self.json_path if path is None else path, json.dumps(rows, indent=4))
+
+    def load(self, path:str|None=None)->dict[str, Row]:
+        if not self.uses_sqlite(path):
+            return self._read_json(path)
+        cur = self._connect().execute(f'SELECT name, data FROM "{self.name}" ORDER BY rowid')
+        return {name:json.loads(data) for name, data in cur}
+
+    def save(self, rows:dict[str, Row], path:str|None=None):
+        """Replaces the whole table."""
+        old = self.load(path) if self.is_default(path) else {}
+        if not self.uses_sqlite(path):
+            self._write_json(rows, path)
+        else:
+            with self._connect() as conn:
+                conn.execute(f'DELETE FROM "{self.name}"')
+                conn.executemany(f'INSERT INTO "{self.name}" (name, data) VALUES (?, ?)', ((k, json.dumps(v)) for k,v in rows.items()))
+                self._bump(conn)
+        #round trip through json so rows compare the same way they would after loading
+        self._publish(path, *diff_rows(old, json.loads(json.dumps(rows))))
+
+    def get(self, key:str, path:str|None=None)->Row|None:
+        if not self.uses_sqlite(path):
+            return self._read_json(path).get(key, None)
+        r = self._connect().execute(f'SELECT data FROM "{self.name}" WHERE name = ?', (key,)).fetchone()
+        return None if r is None else json.loads(r[0])
+
+    def put(self, key:str, row:Row, path:str|None=None):
+        """Inserts or replaces one row. Replaced rows keep their place in the table."""
+        if not self.uses_sqlite(path):
+            rows = self._read_json(path)
+            existed = key in rows
+            rows[key] = row
+            self._write_json(rows, path)
+        else:
+            with self._connect() as conn:
+                existed = conn.execute(f'SELECT 1 FROM "{self.name}" WHERE name = ?', (key,)).fetchone() is not None
+                conn.execute(f'INSERT INTO "{self.name}" (name, data) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET data = excluded.data', (key, json.dumps(row)))
+                self._bump(conn)
+        if existed:
+            self._publish(path, modified=[key])
+        else:
+            self._publish(path, added=[key])
+
+    def delete(self, key:str, path:str|None=None)->bool:
+        """Removes one row, returns False if it didn't exist."""
+        if not self.uses_sqlite(path):
+            rows = self._read_json(path)
+            if key not in rows:
+                return False
+            del rows[key]
+            self._write_json(rows, path)
+        else:
+            with self._connect() as conn:
+                if conn.execute(f'DELETE FROM "{self.name}" WHERE name = ?', (key,)).rowcount == 0:
+                    return False
+                self._bump(conn)
+        self._publish(path, removed=[key])
+        return True
+
+    def dumps(self)->str|None:
+        """Returns the table in the JSON file format, or None if there is nothing stored yet."""
+        if not self.uses_sqlite():
+            return datafile.read_text(self.json_path)
+        return json.dumps(self.load(), indent=4)
+
+    def import_json(self):
+        """Replaces the SQLite table with the contents of the JSON file."""
+        with self._connect() as conn:
+            conn.execute(f'DELETE FROM "{self.name}"')
+            conn.executemany(f'INSERT INTO "{self.name}" (name, data) VALUES (?, ?)', ((k, json.dumps(v)) for k,v in self._read_json(None).items()))
+            self._bump(conn)
+
+    def export_json(self):
+        """Writes the SQLite table out to the JSON file."""
+        self._write_json(self.load(), None)
+
+tables:dict[str, Table] = {}
+
+def table(name:str, json_path:str)->Table:
+    t = tables.get(name, None)
+    if t is None:
+        tables[name] = t = Table(name, json_path)
+    return t
+
+def _register_tables():
+    for name in TABLE_MODULES:
+        if name.endswith(".py"):
+            spec = importlib.util.spec_from_file_location(os.path.basename(name)[:-3], name)
+            spec.loader.exec_module(importlib.util.module_from_spec(spec))
+        else:
+            importlib.import_module(name)
+
+def import_json():
+    use_sqlite(True)
+    _register_tables()
+    for t in tables.values():
+        t.import_json()
+
+def export_json():
+    use_sqlite(True)
+    _register_tables()
+    for t in tables.values():
+        t.export_json()
+    datafile.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moves the bot's data between the JSON files and the SQLite store.")
+    parser.add_argument("direction", choices=["import", "export"], help="`import` copies the JSON files into the SQLite store (and starts using it), `export` writes the SQLite store back out to the JSON files.")
+    args = parser.parse_args()
+    #the table modules import datastore, so use that module instead of __main__
+    import datastore
+    if args.direction == "import":
+        datastore.import_json()
+        print("imported", len(datastore.tables), "tables into", DB_PATH)
+    else:
+        datastore.export_json()
+        print("exported", len(datastore.tables), "tables from", DB_PATH, "\ndelete the database file to go back to using the JSON files")
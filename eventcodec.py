@@ -0,0 +1,116 @@
+"""Wire formats of the event sockets, used by the server and the Python clients.
+
+Event sockets send JSON text unless the client asks for binary frames with `?encoding=`, a comma separated list of
+encodings in order of preference (the server picks the first one it has). `?deflate=1` compresses large frames.
+A binary frame is one header byte, the encoding's tag with `FLAG_DEFLATE` set if it's compressed, and the encoded value."""
+import json
+import zlib
+from typing import Any
+
+try:
+    import msgpack
+except ImportError: #optional, only JSON is available without it
+    msgpack = None
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+FLAG_DEFLATE = 0x01
+DEFLATE_MIN_SIZE = 1024 #smaller frames aren't worth compressing
+DEFLATE_LEVEL = 6
+
+class Codec:
+    name:str
+    tag:int
+
+    def dumps(self, value)->bytes:
+        raise NotImplementedError
+
+    def loads(self, b:bytes)->Any:
+        raise NotImplementedError
+
+    def pack(self, items:list[bytes])->bytes:
+        """Combines already encoded values into an encoded list."""
+        raise NotImplementedError
+
+    def encode_event(self, event)->bytes:
+        return self.dumps(event.to_dict())
+
+class JSONCodec(Codec):
+    name = ENCODING_JSON
+    tag = 0x10
+
+    def dumps(self, value)->bytes:
+        return json.dumps(value).encode("utf-8")
+
+    def loads(self, b:bytes)->Any:
+        return json.loads(b)
+
+    def pack(self, items:list[bytes])->bytes:
+        return b"[" + b",".join(items) + b"]"
+
+    def encode_event(self, event)->bytes:
+        return event.to_json().encode("utf-8")
+
+class MsgpackCodec(Codec):
+    name = ENCODING_MSGPACK
+    tag = 0x20
+
+    def dumps(self, value)->bytes:
+        return msgpack.packb(value)
+
+    def loads(self, b:bytes)->Any:
+        return msgpack.unpackb(b)
+
+    def pack(self, items:list[bytes])->bytes:
+        return msgpack.Packer().pack_array_header(len(items)) + b"".join(items)
+
+codecs:dict[str, Codec] = {ENCODING_JSON: JSONCodec()}
+if msgpack is not None:
+    codecs[ENCODING_MSGPACK] = MsgpackCodec()
+_tags = {codec.tag:codec for codec in codecs.values()}
+
+def preferred_encodings()->str|None:
+    """The `encoding` query value for clients, or None if JSON text is as good as it gets."""
+    if ENCODING_MSGPACK in codecs:
+        return f"{ENCODING_MSGPACK},{ENCODING_JSON}"
+    return None
+
+def negotiate(encodings:str|None)->Codec|None:
+    """Returns the codec for a client's `encoding` query value, or None for JSON text."""
+    if not encodings:
+        return None
+    for name in encodings.split(","):
+        codec = codecs.get(name.strip().lower(), None)
+        if codec is not None:
+            return codec
+    return codecs[ENCODING_JSON]
+
+def frame(codec:Codec, payload:bytes, deflate:bool=False)->bytes:
+    header = codec.tag
+    if deflate and len(payload) >= DEFLATE_MIN_SIZE:
+        compressed = zlib.compress(payload, DEFLATE_LEVEL)
+        if len(compressed) < len(payload):
+            header |= FLAG_DEFLATE
+            payload = compressed
+    return bytes((header,)) + payload
+
+def encode(value, codec:Codec|None=None, deflate:bool=False)->str|bytes:
+    if codec is None:
+        return json.dumps(value)
+    return frame(codec, codec.dumps(value), deflate)
+
+def decode(msg:str|bytes|bytearray|memoryview)->Any:
+    """Decodes a text or binary frame. Raises a ValueError (or zlib.error) if it's invalid."""
+    if isinstance(msg, str):
+        return json.loads(msg)
+    if not msg:
+        raise ValueError("empty frame")
+    header = msg[0]
+    codec = _tags.get(header & ~FLAG_DEFLATE, None)
+    if codec is None:
+        raise ValueError(f"unknown encoding tag {header & ~FLAG_DEFLATE:#x}")
+    payload = bytes(msg[1:])
+    if header & FLAG_DEFLATE:
+        payload = zlib.decompress(payload)
+    return codec.loads(payload)
@@ -1,119 +1,870 @@
+import asyncio
+import bisect
+from collections import deque
+import concurrent.futures
+import eventcodec
+import inspect
+import itertools
 import json
 import threading
-from typing import Callable, Generator
+import time
+import traceback
+from typing import Awaitable, Callable, Generator, Iterable
 from uuid import UUID, uuid4
 
+#what a full bucket does with new events
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_COALESCE = "coalesce" #replaces the queued event with the same key, or drops the oldest one if there isn't one
+OVERFLOW_DISCONNECT = "disconnect" #closes the bucket and drops everything in it
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_COALESCE, OVERFLOW_DISCONNECT)
+
+DEFAULT_BUCKET_CAPACITY = 1024
+DEFAULT_OVERFLOW = OVERFLOW_DROP_OLDEST
+
+DEFAULT_HISTORY_SIZE = 1024 #recent events kept for clients that reconnect
+EVENT_MISSED = "events:missed" #sent to resuming clients when events they missed aren't in the history anymore
+
+LATENCY_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000) #upper bounds of the latency histogram's bins
+RATE_WINDOW = 10 #seconds events per second are averaged over
+DEFAULT_METRICS_LOG_INTERVAL = 60.0
+
+DEFAULT_ASYNC_QUEUE_SIZE = 256
+SUBMIT_POLL_INTERVAL = 0.5 #how often a waiting submit checks that the loop is still running
+SLOW_LISTENER_SECONDS = 0.1
+
+#topics are event names, or prefixes of them ending with "*"
+TOPIC_ALL = "*"
+ROUTE_CACHE_SIZE = 1024
+
+def parse_topic(topic:str)->tuple[str, bool]:
+    """Returns the name or prefix of the topic and whether it's a prefix.
+
+    A topic ending in "*" matches any name starting with the rest of it as plain text, so `chat*` matches `chatter`.
+    Listener patterns (see `is_pattern`) match whole segments instead, they agree for topics like `pngbinds:*`."""
+    if topic.endswith("*"):
+        return topic[:-1], True
+    return topic, False
+
+def topic_matches(topic:str, name:str)->bool:
+    value, is_prefix = parse_topic(topic)
+    return name.startswith(value) if is_prefix else name == value
+
 class Event:
-    def __init__(self, name:str, data:dict[str]|None|None=None):
+    """Events are encoded once (per wire format) and every subscriber sends the same text, so don't change them after dispatching.
+
+    Events with a `key` are state rather than history: pushing one to a bucket replaces the pending event with the same key.
+    `seq` is given by the container the event is dispatched to."""
+    def __init__(self, name:str, data:dict[str]|None|None=None, key:str|None=None, seq:int|None=None):
         self.name = name
         self.data = {} if data is None else data
+        self.key = key
+        self.seq = seq
+        self.dispatched_at:float|None = None #time.monotonic(), set by the container
+        self._json:str|None = None
+        self._encoded:dict[tuple[str, bool|None], bytes] = {}
 
-    def to_json(self):
-        return json.dumps({
+    def to_dict(self)->dict[str]:
+        d = {
             "name": self.name,
             "data": self.data
-        })
+        }
+        if self.key is not None:
+            d["key"] = self.key
+        if self.seq is not None:
+            d["seq"] = self.seq
+        return d
+
+    def to_json(self)->str:
+        s = self._json
+        if s is None:
+            self._json = s = json.dumps(self.to_dict())
+        return s
+
+    def payload(self, codec:eventcodec.Codec)->bytes:
+        """Returns the event encoded with `codec`, without a frame header."""
+        key = codec.name, None
+        b = self._encoded.get(key, None)
+        if b is None:
+            self._encoded[key] = b = codec.encode_event(self)
+        return b
+
+    def encode(self, codec:eventcodec.Codec, deflate:bool=False)->bytes:
+        """Returns the event as a binary frame."""
+        key = codec.name, deflate
+        b = self._encoded.get(key, None)
+        if b is None:
+            self._encoded[key] = b = eventcodec.frame(codec, self.payload(codec), deflate)
+        return b
+
+    def _changed(self):
+        self._json = None
+        self._encoded = {}
+
+def batch_to_json(events:Iterable[Event])->str:
+    """Frames the events as one JSON list, reusing their encoded text."""
+    return "[" + ",".join(event.to_json() for event in events) + "]"
+
+def batch_encode(events:Iterable[Event], codec:eventcodec.Codec, deflate:bool=False)->bytes:
+    """Frames the events as one binary list, reusing their encoded payloads."""
+    return eventcodec.frame(codec, codec.pack([event.payload(codec) for event in events]), deflate)
+
+class LatencyHistogram:
+    """Counts latencies into the bins of `LATENCY_BOUNDS_MS`, with one more for anything slower."""
+    def __init__(self, bounds:tuple[float, ...]=LATENCY_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds:float):
+        ms = seconds * 1e3
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p:float)->float|None:
+        """Returns the upper bound of the bin the `p`th percentile is in, or the max if that's lower."""
+        if not self.count:
+            return None
+        n = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= n and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self)->dict[str]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+            "bins": {(f"<={bound}" if i < len(self.bounds) else f">{self.bounds[-1]}"):count
+                     for i, (bound, count) in enumerate(zip((*self.bounds, None), self.counts))}
+        }
+
+class EventRates:
+    """Counts events by name in one second slots, to tell how many per second there were over the last `window` seconds."""
+    def __init__(self, window:int=RATE_WINDOW):
+        self.window = window
+        self.totals:dict[str, int] = {}
+        self._slots:dict[str, list[int]] = {}
+        self._second = int(time.monotonic())
+
+    def _advance(self):
+        now = int(time.monotonic())
+        if now == self._second:
+            return
+        for slots in self._slots.values():
+            if now - self._second >= self.window:
+                slots[:] = [0] * self.window
+            else:
+                for second in range(self._second + 1, now + 1):
+                    slots[second % self.window] = 0
+        self._second = now
+
+    def add(self, name:str):
+        self._advance()
+        slots = self._slots.get(name, None)
+        if slots is None:
+            self._slots[name] = slots = [0] * self.window
+        slots[self._second % self.window] += 1
+        self.totals[name] = self.totals.get(name, 0) + 1
+
+    def rates(self)->dict[str, float]:
+        self._advance()
+        return {name:sum(slots) / self.window for name, slots in self._slots.items()}
+
+EventKeyFunc = Callable[[Event], object]
+
+def event_name_key(event:Event):
+    return event.name
+
+def event_coalesce_key(event:Event):
+    return event.name if event.key is None else event.key
 
 class EventBucket:
-    """Collects events so that they can later be handled all at once."""
-    def __init__(self, id:UUID, queue:list[Event]|None=None):
+    """Collects events so that they can later be handled all at once.
+
+    At most `capacity` events are kept (None for no limit), after that the `overflow` policy decides what's dropped.
+    Dropped events are counted in `dropped`. With `OVERFLOW_DISCONNECT` the bucket is `closed` instead, and its reader should disconnect.
+    Keyed events replace the pending one with the same key at any size, those are counted in `coalesced`."""
+    def __init__(self, id:UUID, queue:Iterable[Event]|None=None, capacity:int|None=DEFAULT_BUCKET_CAPACITY,
+                 overflow:str=DEFAULT_OVERFLOW, coalesce_key:EventKeyFunc=event_coalesce_key, topics:Iterable[str]=(TOPIC_ALL,)):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
         self.id = id
-        self.queue = [] if queue is None else queue
+        self.topics = frozenset(topics) #change these through the container so it can route events to the bucket
+        self.queue:deque[Event] = deque() if queue is None else deque(queue)
+        self._keyed = {event.key:event for event in self.queue if event.key is not None} #the pending event of each key
+        self.capacity = capacity
+        self.overflow = overflow
+        self.coalesce_key = coalesce_key
+        self.dropped = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.high_water = len(self.queue) #the most events the bucket has held
+        self.latency = LatencyHistogram() #from dispatching an event to it having been handled
+        self.closed = False
         self.lock = threading.Lock()
         self._event = threading.Event()
 
     def __len__(self):
         return len(self.queue)
 
+    def matches(self, name:str)->bool:
+        return any(topic_matches(topic, name) for topic in self.topics)
+
     def wait(self, timeout:float|None=None):
-        """Wait for an event to be added to the bucket."""
+        """Wait for an event to be added to the bucket, or for the bucket to be closed."""
         return self._event.wait(timeout)
 
+    def _forget(self, event:Event):
+        if event.key is not None and self._keyed.get(event.key, None) is event:
+            del self._keyed[event.key]
+
+    def _append(self, event:Event):
+        queue = self.queue
+        if event.key is not None:
+            pending = self._keyed.get(event.key, None)
+            if pending is not None:
+                queue.remove(pending)
+                self.coalesced += 1
+            self._keyed[event.key] = event
+        if self.capacity is None or len(queue) < self.capacity:
+            queue.append(event)
+            if len(queue) > self.high_water:
+                self.high_water = len(queue)
+            return
+        if self.overflow == OVERFLOW_DROP_OLDEST:
+            self._forget(queue.popleft())
+            queue.append(event)
+        elif self.overflow == OVERFLOW_COALESCE:
+            key = self.coalesce_key(event)
+            for i, queued in enumerate(queue):
+                if self.coalesce_key(queued) == key:
+                    del queue[i]
+                    self._forget(queued)
+                    break
+            else:
+                self._forget(queue.popleft())
+            queue.append(event)
+        else:
+            if self.overflow == OVERFLOW_DISCONNECT:
+                self.dropped += len(queue)
+                queue.clear()
+                self._keyed.clear()
+                self.closed = True
+            #OVERFLOW_DROP_NEWEST doesn't add the event
+            self._forget(event)
+        self.dropped += 1
+
     def push(self, *events:Event):
         """Add an event to the bucket."""
         with self.lock:
-            self.queue.extend(events)
-            self._event.set()
+            for event in events:
+                if self.closed:
+                    self.dropped += 1
+                else:
+                    self._append(event)
+            if self.queue or self.closed:
+                self._event.set()
 
     def dump(self)->Generator[Event, None, None]:
-        """Returns a generator to handle the events with. After iterating over all the events, the bucket is emptied."""
-        if self.queue:
+        """Returns a generator to handle the events with.
+
+        The queued events are swapped out for an empty queue before any are yielded, so pushing never waits on whatever
+        the caller does with them. Events that weren't handled (if the caller stops early) are put back in the bucket."""
+        if not self.queue:
             with self.lock:
-                for event in self.queue:
-                    yield event
-                self.queue.clear()
+                if not self.queue and not self.closed:
+                    self._event.clear()
+            return
+        with self.lock:
+            queue = self.queue
+            self.queue = deque()
+            self._keyed = {}
+            if not self.closed:
                 self._event.clear()
+        try:
+            while queue:
+                yield queue[0]
+                event = queue.popleft()
+                self.sent += 1
+                if event.dispatched_at is not None:
+                    self.latency.add(time.monotonic() - event.dispatched_at)
+        finally:
+            if queue:
+                with self.lock:
+                    #newer events go through the overflow policy again on top of the ones put back
+                    newer = self.queue
+                    self.queue = queue
+                    self._keyed = {event.key:event for event in queue if event.key is not None}
+                    for event in newer:
+                        self._append(event)
+                    self._event.set()
+
+    def metrics(self)->dict[str]:
+        return {
+            "id": str(self.id),
+            "topics": sorted(self.topics),
+            "queued": len(self.queue),
+            "high_water": self.high_water,
+            "capacity": self.capacity,
+            "overflow": self.overflow,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "closed": self.closed,
+            "latency": self.latency.to_dict()
+        }
 
     def clear(self):
         """Clears all the events in the bucket without handling them."""
         with self.lock:
             self.queue.clear()
+            self._keyed.clear()
             self._event.clear()
 
 
 class EventBucketContainer:
-    def __init__(self, buckets:dict[UUID, EventBucket]|None=None):
+    """Dispatches events to the buckets subscribed to them.
+
+    Buckets are indexed by the names and prefixes of their topics, and the buckets each event name goes to are cached,
+    so dispatching never touches buckets that aren't subscribed to the event.
+
+    Dispatched events are numbered with increasing `seq`s and the last `history_size` are kept, so a bucket made for a
+    client that reconnects can start with the events it missed."""
+    def __init__(self, buckets:dict[UUID, EventBucket]|None=None, capacity:int|None=DEFAULT_BUCKET_CAPACITY, overflow:str=DEFAULT_OVERFLOW,
+                 history_size:int=DEFAULT_HISTORY_SIZE):
         self.buckets = {} if buckets is None else buckets
+        self.capacity = capacity
+        self.overflow = overflow
+        self.seq = 0 #of the last dispatched event
+        self.history:deque[Event] = deque(maxlen=history_size)
+        self.rates = EventRates()
+        self._removed_dropped = 0
+        self._lock = threading.RLock() #also held while dispatching, so a resuming bucket gets each event once
+        self._names:dict[str, dict[UUID, EventBucket]] = {}
+        self._prefixes:dict[str, dict[UUID, EventBucket]] = {}
+        self._routes:dict[str, tuple[EventBucket, ...]] = {}
+        for bucket in self.buckets.values():
+            self._index(bucket, bucket.topics)
+
+    @property
+    def dropped(self)->int:
+        """Number of events dropped by all of the buckets, including removed ones."""
+        return self._removed_dropped + sum(bucket.dropped for bucket in list(self.buckets.values()))
+
+    def _index(self, bucket:EventBucket, topics:Iterable[str], remove:bool=False):
+        for topic in topics:
+            value, is_prefix = parse_topic(topic)
+            index = self._prefixes if is_prefix else self._names
+            if remove:
+                subscribed = index.get(value, None)
+                if subscribed is not None:
+                    subscribed.pop(bucket.id, None)
+                    if not subscribed:
+                        del index[value]
+            else:
+                index.setdefault(value, {})[bucket.id] = bucket
+        self._routes = {}
 
-    def new_bucket(self, id:UUID|None=None)->EventBucket:
+    def new_bucket(self, id:UUID|None=None, capacity:int|None=..., overflow:str|None=None, topics:Iterable[str]|None=None, since:int|None=None)->EventBucket:
+        """`capacity` and `overflow` default to the container's, and the bucket gets every event unless given `topics`.
+
+        With `since`, the bucket starts with the events after that `seq` from the history. If some of them aren't there
+        anymore (or `since` is from before the container was made), it starts with an `EVENT_MISSED` event instead."""
         if id is None:
             id = uuid4()
-        self.buckets[id] = bucket = EventBucket(id)
+        bucket = EventBucket(id, capacity=self.capacity if capacity is ... else capacity, overflow=self.overflow if overflow is None else overflow,
+                             topics=(TOPIC_ALL,) if topics is None else topics)
+        with self._lock:
+            if since is not None:
+                self._replay(bucket, since)
+            self.buckets[id] = bucket
+            self._index(bucket, bucket.topics)
         return bucket
 
+    def _replay(self, bucket:EventBucket, since:int):
+        oldest = self.history[0].seq if self.history else self.seq + 1
+        if since > self.seq or since < oldest - 1:
+            bucket.push(Event(EVENT_MISSED, {"since": since, "oldest": oldest, "seq": self.seq}))
+            if since > self.seq:
+                return #numbered by something else, probably before a restart
+            since = oldest - 1
+        missed = [event for event in itertools.islice(self.history, since - oldest + 1, None) if bucket.matches(event.name)]
+        if missed:
+            bucket.push(*missed)
+
     def remove_bucket(self, x:UUID|EventBucket)->EventBucket|None:
         id = x.id if isinstance(x, EventBucket) else x
-        return self.buckets.pop(id, None)
-    
+        with self._lock:
+            bucket = self.buckets.pop(id, None)
+            if bucket is not None:
+                self._index(bucket, bucket.topics, remove=True)
+                self._removed_dropped += bucket.dropped
+        return bucket
+
+    def set_topics(self, bucket:EventBucket, topics:Iterable[str]):
+        """Replaces the topics the bucket is subscribed to."""
+        topics = frozenset(topics)
+        with self._lock:
+            if self.buckets.get(bucket.id, None) is bucket:
+                self._index(bucket, bucket.topics - topics, remove=True)
+                self._index(bucket, topics - bucket.topics)
+            bucket.topics = topics
+
+    def subscribe(self, bucket:EventBucket, *topics:str):
+        self.set_topics(bucket, bucket.topics.union(topics))
+
+    def unsubscribe(self, bucket:EventBucket, *topics:str):
+        self.set_topics(bucket, bucket.topics.difference(topics))
+
+    def route(self, name:str)->tuple[EventBucket, ...]:
+        """Returns the buckets subscribed to events named `name`."""
+        route = self._routes.get(name, None)
+        if route is None:
+            with self._lock:
+                found = dict(self._names.get(name, {}))
+                for prefix, subscribed in self._prefixes.items():
+                    if name.startswith(prefix):
+                        found.update(subscribed)
+                route = tuple(found.values())
+                if len(self._routes) >= ROUTE_CACHE_SIZE:
+                    self._routes = {}
+                self._routes[name] = route
+        return route
+
+    def _number(self, event:Event):
+        self.seq += 1
+        event.seq = self.seq
+        event.dispatched_at = time.monotonic()
+        event._changed()
+        self.history.append(event)
+        self.rates.add(event.name)
+
+    def metrics(self)->dict[str]:
+        """Returns the state of every bucket and how many events of each name were dispatched."""
+        with self._lock:
+            buckets = [bucket.metrics() for bucket in self.buckets.values()]
+            rates = self.rates.rates()
+            totals = dict(self.rates.totals)
+        return {
+            "seq": self.seq,
+            "dropped": self.dropped,
+            "buckets": buckets,
+            "events_per_second": rates,
+            "events_total": totals
+        }
+
     def dispatch(self, *events:Event):
-        for bucket in self.buckets.values():
-            bucket.push(*events)
+        with self._lock:
+            if len(events) == 1:
+                event = events[0]
+                self._number(event)
+                for bucket in self.route(event.name):
+                    bucket.push(event)
+                return
+            #keep each bucket's events in order and pushed all at once
+            batches:dict[UUID, tuple[EventBucket, list[Event]]] = {}
+            for event in events:
+                self._number(event)
+                for bucket in self.route(event.name):
+                    batch = batches.get(bucket.id, None)
+                    if batch is None:
+                        batches[bucket.id] = bucket, [event]
+                    else:
+                        batch[1].append(event)
+            for bucket, batch in batches.values():
+                bucket.push(*batch)
 
-EventListenerCallback = Callable[[Event], None]
+EventListenerCallback = Callable[[Event], None|Awaitable[None]]
 
 class EventListener:
-    def __init__(self, callback:EventListenerCallback, once:bool=False):
+    """Listeners with a higher `priority` are called first. `blocking` listeners are called on the collection's
+    executor, if it has one, so they don't hold up the thread handling the event."""
+    def __init__(self, callback:EventListenerCallback, once:bool=False, priority:int=0, blocking:bool=False):
         self.callback = callback
         self.once = once
+        self.priority = priority
+        self.blocking = blocking
+        self.order:int|None = None #set by the collection it's added to, breaks ties between priorities
+
+class ListenerGroup:
+    """The listeners of one event name or pattern. Adding and removing them is O(1)."""
+    def __init__(self):
+        self.listeners:dict[int, EventListener] = {} #by id, in the order they were added
+
+    def __len__(self):
+        return len(self.listeners)
+
+    def add(self, listener:EventListener):
+        self.listeners[id(listener)] = listener
+
+    def remove(self, listener:EventListener)->bool:
+        return self.listeners.pop(id(listener), None) is not None
+
+    def find(self, callback:EventListenerCallback)->EventListener|None:
+        for listener in self.listeners.values():
+            if listener.callback == callback:
+                return listener
+        return None
+
+def is_pattern(name:str)->bool:
+    """Listener patterns have "*" segments (split by ":"), which match any one segment, or the rest of the name if it's the last one.
+
+    `pngbinds:*` matches `pngbinds:state_change`, and `*:error` matches `soundreq:error`. `*` matches everything.
+    Unlike bucket topics (see `parse_topic`), "*" is only a wildcard as a whole segment: `chat*` is a plain event name,
+    and doesn't match `chatter`."""
+    return "*" in name.split(":")
+
+class PatternTrie:
+    """Listener patterns by segment, to find the ones matching an event name without trying each of them."""
+    __slots__ = ("children", "wildcard", "patterns", "rest")
+
+    def __init__(self, patterns:Iterable[str]=()):
+        self.children:dict[str, PatternTrie] = {}
+        self.wildcard:PatternTrie|None = None
+        self.patterns:list[str] = [] #patterns that end here
+        self.rest:list[str] = [] #patterns whose last "*" matches the rest of the name from here
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern:str):
+        node = self
+        segments = pattern.split(":")
+        for i, segment in enumerate(segments):
+            if segment == "*":
+                if i == len(segments) - 1:
+                    node.rest.append(pattern)
+                    return
+                if node.wildcard is None:
+                    node.wildcard = PatternTrie()
+                node = node.wildcard
+            else:
+                child = node.children.get(segment, None)
+                if child is None:
+                    node.children[segment] = child = PatternTrie()
+                node = child
+        node.patterns.append(pattern)
+
+    def match(self, name:str)->list[str]:
+        found = []
+        self._match(name.split(":"), 0, found)
+        return found
+
+    def _match(self, segments:list[str], i:int, found:list[str]):
+        if i == len(segments):
+            found.extend(self.patterns)
+            return
+        found.extend(self.rest)
+        child = self.children.get(segments[i], None)
+        if child is not None:
+            child._match(segments, i + 1, found)
+        if self.wildcard is not None:
+            self.wildcard._match(segments, i + 1, found)
+
+async def _await(awaitable:Awaitable):
+    return await awaitable
+
+def _report_listener_error(future:concurrent.futures.Future):
+    if not future.cancelled() and (e := future.exception()) is not None:
+        print("events: error in listener:")
+        traceback.print_exception(e)
+
+#the listeners for an event name, with the name or pattern each was added with
+ResolvedListeners = tuple[tuple[EventListener, str], ...]
 
 class EventListenerCollection:
-    def __init__(self, listeners:dict[str, list[EventListener]]|None=None):
-        self.listeners = {} if listeners is None else listeners
+    """Calls listeners for events by name, or by pattern (see `is_pattern`).
 
-    def add_listener(self, name:str, x:EventListener|EventListenerCallback):
+    The listeners for each event name are found once and cached until listeners are added or removed, so patterns
+    cost nothing when handling events. Listeners with a higher priority are called first, then in the order they were added.
+
+    `async def` listeners are awaited by `handle_event_async`. `handle_event` schedules them on the running loop,
+    or on `loop` when called from another thread, or runs them to completion if there's neither."""
+    def __init__(self, listeners:dict[str, Iterable[EventListener]]|None=None, executor:concurrent.futures.Executor|None=None,
+                 loop:asyncio.AbstractEventLoop|None=None):
+        self.listeners:dict[str, ListenerGroup] = {} #by event name
+        self.patterns:dict[str, ListenerGroup] = {}
+        self.executor = executor
+        self.loop = loop
+        self._trie = PatternTrie()
+        self._resolved:dict[str, ResolvedListeners] = {}
+        self._added = itertools.count()
+        self._lock = threading.Lock()
+        self._tasks:set[asyncio.Future] = set()
+        if listeners is not None:
+            for name, group in listeners.items():
+                for listener in group:
+                    self.add_listener(name, listener)
+
+    def _groups(self, name:str)->dict[str, ListenerGroup]:
+        return self.patterns if is_pattern(name) else self.listeners
+
+    def _changed(self, patterns_changed:bool=False):
+        if patterns_changed:
+            self._trie = PatternTrie(self.patterns)
+        self._resolved = {}
+
+    def add_listener(self, name:str, x:EventListener|EventListenerCallback, priority:int=0, once:bool=False, blocking:bool=False)->EventListener:
+        """`name` can be a pattern. `priority`, `once` and `blocking` are only used when given a callback."""
         if not isinstance(x, EventListener):
-            x = EventListener(x)
-        if name in self.listeners:
-            self.listeners[name].append(x)
-        else:
-            self.listeners[name] = [x]
+            x = EventListener(x, once, priority, blocking)
+        with self._lock:
+            groups = self._groups(name)
+            group = groups.get(name, None)
+            new_group = group is None
+            if new_group:
+                groups[name] = group = ListenerGroup()
+            group.add(x)
+            if x.order is None:
+                x.order = next(self._added)
+            self._changed(new_group and groups is self.patterns)
+        return x
+
+    def _remove(self, name:str, listener:EventListener)->bool:
+        groups = self._groups(name)
+        group = groups.get(name, None)
+        if group is None or not group.remove(listener):
+            return False
+        removed_group = not group
+        if removed_group:
+            del groups[name]
+        self._changed(removed_group and groups is self.patterns)
+        return True
+
+    def remove_listener(self, name:str, x:EventListener|EventListenerCallback)->bool:
+        with self._lock:
+            group = self._groups(name).get(name, None)
+            if group is None:
+                return False
+            listener = x if isinstance(x, EventListener) else group.find(x)
+            return listener is not None and self._remove(name, listener)
 
-    def listener(self, name:str):
+    def listener(self, name:str, priority:int=0, once:bool=False, blocking:bool=False):
         def decor(f:EventListenerCallback):
-            self.add_listener(name, f)
+            self.add_listener(name, f, priority, once, blocking)
             return f
         return decor
 
+    def _resolve(self, name:str)->ResolvedListeners:
+        resolved = self._resolved.get(name, None)
+        if resolved is None:
+            with self._lock:
+                found:list[tuple[EventListener, str]] = []
+                group = self.listeners.get(name, None)
+                if group is not None:
+                    found.extend((listener, name) for listener in group.listeners.values())
+                for pattern in self._trie.match(name):
+                    found.extend((listener, pattern) for listener in self.patterns[pattern].listeners.values())
+                found.sort(key=lambda pair: (-pair[0].priority, pair[0].order))
+                resolved = tuple(found)
+                if len(self._resolved) >= ROUTE_CACHE_SIZE:
+                    self._resolved = {}
+                self._resolved[name] = resolved
+        return resolved
+
+    def get_listeners(self, name:str)->tuple[EventListener, ...]:
+        """Returns the listeners for events named `name`, in the order they're called."""
+        return tuple(listener for listener, _ in self._resolve(name))
+
+    def _claim(self, added_as:str, listener:EventListener)->bool:
+        """Removes a `once` listener before it's called, returns False if it was already removed (by another thread)."""
+        with self._lock:
+            return self._remove(added_as, listener)
+
+    def _schedule(self, awaitable:Awaitable):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            task = asyncio.ensure_future(awaitable)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif self.loop is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(_await(awaitable), self.loop).add_done_callback(_report_listener_error)
+        else:
+            asyncio.run(_await(awaitable))
+
+    def _call(self, listener:EventListener, event:Event):
+        r = listener.callback(event)
+        if inspect.isawaitable(r):
+            self._schedule(r)
+
     def handle_event(self, event:Event):
-        if event.name in self.listeners:
-            i = 0
-            listeners = self.listeners[event.name]
-            while i < len(listeners):
-                listener = listeners[i]
-                listener.callback(event)
-                if listener.once:
-                    listeners.pop(i)
-                else:
-                    i += 1
-            if not listeners:
-                self.listeners.pop(event.name)
-    
+        for listener, added_as in self._resolve(event.name):
+            if listener.once and not self._claim(added_as, listener):
+                continue
+            if listener.blocking and self.executor is not None:
+                self.executor.submit(self._call, listener, event).add_done_callback(_report_listener_error)
+            else:
+                self._call(listener, event)
+
+    async def handle_event_async(self, event:Event, timings:"ListenerTimings|None"=None):
+        """Like `handle_event`, but awaits `async def` listeners and records how long each listener takes.
+
+        `blocking` listeners run on the collection's executor (or the loop's default one) while the loop keeps going."""
+        for listener, added_as in self._resolve(event.name):
+            if listener.once and not self._claim(added_as, listener):
+                continue
+            start = time.perf_counter()
+            if listener.blocking:
+                r = await asyncio.get_running_loop().run_in_executor(self.executor, listener.callback, event)
+            else:
+                r = listener.callback(event)
+            if inspect.isawaitable(r):
+                await r
+            if timings is not None:
+                timings.record(listener.callback, event, time.perf_counter() - start)
+
+def listener_name(callback:Callable)->str:
+    return f"{getattr(callback, "__module__", None)}.{getattr(callback, "__qualname__", type(callback).__qualname__)}"
+
+class ListenerTimings:
+    """How many times each listener was called, and for how long in total and at most."""
+    def __init__(self, slow_seconds:float|None=SLOW_LISTENER_SECONDS):
+        self.slow_seconds = slow_seconds
+        self.timings:dict[str, list[float]] = {} #listener name -> [calls, total seconds, max seconds]
+
+    def record(self, callback:Callable, event:Event, seconds:float):
+        name = listener_name(callback)
+        timing = self.timings.get(name, None)
+        if timing is None:
+            self.timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+        if self.slow_seconds is not None and seconds >= self.slow_seconds:
+            print(f"events: listener {name} took {seconds*1e3:.1f} ms to handle {event.name}")
+
+    def slowest(self, n:int=10)->list[tuple[str, int, float, float]]:
+        """Returns the name, calls, total and max seconds of the listeners that took the longest in total."""
+        return sorted(((name, *timing) for name, timing in self.timings.items()), key=lambda t: t[2], reverse=True)[:n]
+
+class AsyncEventDispatcher:
+    """Hands events from other threads to an asyncio loop, where their listeners are called.
+
+    `run` is started as a task on the loop. `submit` waits while the queue is full, so a thread reading events from a
+    socket stops reading instead of letting the queue grow."""
+    def __init__(self, collection:EventListenerCollection|None=None, maxsize:int=DEFAULT_ASYNC_QUEUE_SIZE, timings:ListenerTimings|None=None):
+        self.collection = default_listeners if collection is None else collection
+        self.maxsize = maxsize
+        self.timings = ListenerTimings() if timings is None else timings
+        self.loop:asyncio.AbstractEventLoop|None = None
+        self.queue:asyncio.Queue[Event]|None = None
+        self._ready = threading.Event()
+
+    async def run(self):
+        self.queue = asyncio.Queue(self.maxsize)
+        self.loop = asyncio.get_running_loop()
+        self._ready.set()
+        try:
+            while True:
+                event = await self.queue.get()
+                try:
+                    await self.collection.handle_event_async(event, self.timings)
+                except Exception as e:
+                    print(f"events: error handling {event.name}:")
+                    traceback.print_exception(e)
+        finally:
+            self.close()
+
+    def close(self):
+        """Makes `submit` stop waiting for the loop."""
+        self.loop = None
+        self.queue = None
+        self._ready.set()
+
+    def _running(self, loop:asyncio.AbstractEventLoop)->bool:
+        return self.loop is loop and loop.is_running()
+
+    def submit(self, event:Event, timeout:float|None=None)->bool:
+        """Queues the event from another thread, returns False if the dispatcher isn't running or the queue stayed full.
+
+        While waiting, the loop is checked every `SUBMIT_POLL_INTERVAL` seconds, so the thread gives up (and drops the
+        event) once the loop stops or the dispatcher is closed, instead of waiting on a loop that will never take it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        def interval()->float:
+            return SUBMIT_POLL_INTERVAL if deadline is None else max(0.0, min(SUBMIT_POLL_INTERVAL, deadline - time.monotonic()))
+        def expired()->bool:
+            return deadline is not None and time.monotonic() >= deadline
+
+        while not self._ready.wait(interval()):
+            if expired():
+                return False
+        loop, queue = self.loop, self.queue
+        if loop is None or queue is None:
+            return False
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(event), loop)
+        except RuntimeError: #the loop was closed
+            return False
+        while True:
+            try:
+                future.result(interval())
+                return True
+            except concurrent.futures.CancelledError:
+                return False
+            except TimeoutError:
+                if expired() or not self._running(loop):
+                    future.cancel()
+                    return False
+
+def format_metrics(metrics:dict[str])->list[str]:
+    """Returns log lines for `EventBucketContainer.metrics`, a summary and one for each bucket."""
+    rate = sum(metrics["events_per_second"].values())
+    lines = [f"events: seq {metrics["seq"]}, {rate:.1f}/s, {len(metrics["buckets"])} buckets, {metrics["dropped"]} dropped"]
+    def ms(value:float|None)->str:
+        return "-" if value is None else f"{value:.1f}"
+    for bucket in metrics["buckets"]:
+        latency = bucket["latency"]
+        lines.append(f"events:   {bucket["id"][:8]} queued {bucket["queued"]} (max {bucket["high_water"]}), sent {bucket["sent"]}, "
+                     f"dropped {bucket["dropped"]}, p50 {ms(latency["p50_ms"])} ms, p99 {ms(latency["p99_ms"])} ms")
+    return lines
+
+class MetricsLogger:
+    """Prints the metrics of a container every `interval` seconds."""
+    def __init__(self, container:"EventBucketContainer", interval:float=DEFAULT_METRICS_LOG_INTERVAL):
+        self.container = container
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread:threading.Thread|None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for line in format_metrics(self.container.metrics()):
+                print(line)
+
 
 default_container = EventBucketContainer()
 default_listeners = EventListenerCollection()
 
-def new_bucket(id:UUID|None=None, container:EventBucketContainer=default_container):
-    return container.new_bucket(id)
+def new_bucket(id:UUID|None=None, container:EventBucketContainer=default_container, capacity:int|None=..., overflow:str|None=None, topics:Iterable[str]|None=None, since:int|None=None):
+    return container.new_bucket(id, capacity, overflow, topics, since)
 
 def remove_bucket(x:UUID|EventBucket, container:EventBucketContainer=default_container):
     return container.remove_bucket(x)
@@ -121,11 +872,30 @@ def remove_bucket(x:UUID|EventBucket, container:EventBucketContainer=default_con
 def dispatch(*events:Event, container:EventBucketContainer=default_container):
     return container.dispatch(*events)
 
-def add_listener(name:str, x:EventListener|EventListenerCallback, collection:EventListenerCollection=default_listeners):
-    return collection.add_listener(name, x)
+def add_listener(name:str, x:EventListener|EventListenerCallback, collection:EventListenerCollection=default_listeners, priority:int=0, once:bool=False, blocking:bool=False):
+    return collection.add_listener(name, x, priority, once, blocking)
+
+def remove_listener(name:str, x:EventListener|EventListenerCallback, collection:EventListenerCollection=default_listeners):
+    return collection.remove_listener(name, x)
 
-def listener(name:str, collection:EventListenerCollection=default_listeners):
-    return collection.listener(name)
+def listener(name:str, collection:EventListenerCollection=default_listeners, priority:int=0, once:bool=False, blocking:bool=False):
+    return collection.listener(name, priority, once, blocking)
 
 def handle_event(event:Event, collection:EventListenerCollection=default_listeners):
-    return collection.handle_event(event)
\ No newline at end of file
+    return collection.handle_event(event)
+
+metrics_logger:MetricsLogger|None = None
+
+def start_metrics_log(interval:float=DEFAULT_METRICS_LOG_INTERVAL, container:EventBucketContainer=default_container)->MetricsLogger:
+    global metrics_logger
+    stop_metrics_log()
+    metrics_logger = MetricsLogger(container, interval)
+    metrics_logger.start()
+    return metrics_logger
+
+def stop_metrics_log():
+    global metrics_logger
+    if metrics_logger is not None:
+        old = metrics_logger
+        metrics_logger = None
+        old.stop()
@@ -4,6 +4,7 @@ monkey.patch_all() #must be called first
 
 import argparse
 import config
+import events
 import plugins
 import traceback
 import twitch_reauth
@@ -15,8 +16,9 @@ parser.add_argument("--remote-api", default=None, help="The IP/Domain:Port to co
 parser.add_argument("-p", "--plugin-configs", default=config.PLUGIN_FILE, help="Path to the plugin config file to use.")
 parser.add_argument("-c", "--configs", default=config.CONFIG_FILE, help="Path to the config file to use.")
 parser.add_argument("-C", "--core-component", action="append", default=[], help="Set modes for core components with <name>=<mode> syntax. These modes can be normal|remote|off")
+parser.add_argument("--event-metrics", type=float, default=0, metavar="SECONDS", help="Print the event sockets' queue depths, lag and dropped events every so many seconds. Also available at /api/events/metrics.")
 
-def get_args()->tuple[tuple[str, int], str|None, str, dict[str, str|None]]:
+def get_args()->tuple[tuple[str, int], str|None, str, str, dict[str, str|None], float]:
     args = parser.parse_args()
     addr_arg:str = args.addr
     if ":" in addr_arg:
@@ -57,9 +59,13 @@ def get_args()->tuple[tuple[str, int], str|None, str, dict[str, str|None]]:
             print("Core component must be in the <name>=<mode> format, got:", expr)
             exit(-1)
     
-    return addr, args.remote_api, args.configs, args.plugin_configs, components
+    return addr, args.remote_api, args.configs, args.plugin_configs, components, args.event_metrics
 
-def run(addr:tuple[str, int]=(web.HOST, web.PORT), remote_api_addr:str=None, pconfig_path:str=config.PLUGIN_FILE, core_components:dict[str, str|None]={}):
+def run(addr:tuple[str, int]=(web.HOST, web.PORT), remote_api_addr:str=None, pconfig_path:str=config.PLUGIN_FILE, core_components:dict[str, str|None]={},
+        event_metrics_interval:float=0):
+    print("starting config watcher")
+    watcher = config.start_watcher()
+    print("watching configs", "with inotify" if watcher.uses_inotify else "by polling")
     print("reading plugin list")
     plugin_list = plugins.read_plugin_data(path=pconfig_path)
     plugin_enabled_count = sum(1 for plugin in plugin_list.values() if plugin.module is not None and plugin.startup_load)
@@ -104,6 +110,8 @@ def run(addr:tuple[str, int]=(web.HOST, web.PORT), remote_api_addr:str=None, pco
         
 
     web.attach_core(interface_mode, api_mode, tronix_mode, remote_api_addr)
+    if event_metrics_interval > 0:
+        events.start_metrics_log(event_metrics_interval)
 
     print("starting web server")
     e = None
@@ -120,6 +128,9 @@ def run(addr:tuple[str, int]=(web.HOST, web.PORT), remote_api_addr:str=None, pco
         if plugin.module is not None:
             plugin.unload(plugins.UnloadEvent(plugin_list, plugin, True, e))
     print("unloaded plugins")
+    web.detach_core()
+    events.stop_metrics_log()
+    config.stop_watcher()
 
 if __name__ == "__main__":
     oauth = config.read(path=config.OAUTH_TWITCH_FILE)
@@ -133,7 +144,7 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             pass
     else:
-        addr, remote_api_addr, config_path, pconfig_path, core_components = get_args()
+        addr, remote_api_addr, config_path, pconfig_path, core_components, event_metrics_interval = get_args()
         config.CONFIG_FILE = config_path
-        run(addr, remote_api_addr, pconfig_path, core_components)
+        run(addr, remote_api_addr, pconfig_path, core_components, event_metrics_interval)
         exit(0)
\ No newline at end of file
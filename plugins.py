@@ -6,6 +6,7 @@ import re
 import sys
 from types import ModuleType
 from typing import Any, Callable
+import weakref
 
 from twitchio.ext.commands import Bot
 
@@ -15,6 +16,7 @@ MetaTypeCommand = str
 MetaTypeExpression = MetaTypeOptions | MetaTypeAllowed | MetaTypeCommand
 
 DataTarget = tuple[str, Any]
+Validator = Callable[[Any], Any]
 
 class EventCallbackContext:
     """Context for handling a plugin event."""
@@ -157,6 +159,14 @@ class MetaField:
         self.types = types
         self.optional = optional
         self.default = default
+        self._validator:Validator|None = None
+
+    @property
+    def validator(self)->Validator:
+        """Compiled validator for this field's type expressions, see `compile_field`."""
+        if self._validator is None:
+            self._validator = compile_field(self)
+        return self._validator
 
     @property
     def is_optional(self)->bool:
@@ -173,6 +183,18 @@ class Meta:
         self.description = description
         self.configs = configs
         self.components = components
+        self._validator:Validator|None = None
+
+    @property
+    def validator(self)->Validator:
+        """Compiled validator for the configs described by this metadata, see `compile_fields`."""
+        if self._validator is None:
+            self._validator = _validate_any if self.configs is excluded else compile_fields(self.configs)
+        return self._validator
+
+    def apply(self, c:dict[str])->dict[str]:
+        """Validates the configs and applies defaults to them."""
+        return self.validator(c)
 
 ComponentList = dict[str, str|None]
     
@@ -337,262 +359,259 @@ def parse_plugin_meta(data:dict[str])->Meta:
                 components[name] = allowed
     else:
         components = excluded
-    return Meta(name=name, description=description, configs=configs, components=components)
+    meta = Meta(name=name, description=description, configs=configs, components=components)
+    meta.validator #compile ahead of time
+    return meta
+
+def _validate_any(v):
+    return v
+
+def _compile_error(exc_type:type[Exception], *args)->Validator:
+    #errors in the metadata itself are only raised once a value is validated against it
+    def validate(v):
+        raise exc_type(*args)
+    return validate
+
+def _compile_not_allowed(tname:str, field:MetaField)->Validator:
+    return _compile_error(MetaTypeInvalidException, f"Type \"{tname}\" not allowed for field {field.key}.")
+
+def _compile_type_command(field_t:str, field:MetaField, default_is_same_type:bool, apply_default:Validator)->Validator:
+    if field_t == TYPE_COMMAND_EXCLUDE:
+        if field.default is not excluded:
+            return (lambda v: excluded) if default_is_same_type else apply_default
+        elif field.optional is excluded or not field.optional:
+            return _compile_error(ConfigMissingMetaFieldException, f"Missing field {field.key}.")
+        return lambda v: None
+    return _compile_error(MetaInvalidTypeCommandError, f"Invalid field type command: {field_t}")
 
-def _config_apply_meta_list(v:list, field:MetaField):
-    field_t = field.types.get(TYPE_NAME_LIST)
+def _compile_common(tname:str, field:MetaField, default_is_same_type:bool, apply_default:Validator)->Validator|None:
+    """Compiles the type expressions shared by all types. Returns None for option dicts, which are type specific."""
+    field_t = field.types.get(tname, None)
     if field_t is None:
-        raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_LIST}\" not allowed for field {field.key}.")
+        return _compile_not_allowed(tname, field)
     elif isinstance(field_t, bool):
-        if field_t:
-            return v
-        else:
-            raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_LIST}\" not allowed for field {field.key}.")
+        return _validate_any if field_t else _compile_not_allowed(tname, field)
     elif isinstance(field_t, str):
-        if field_t == TYPE_COMMAND_EXCLUDE:
-            if field.default is not excluded:
-                return excluded if isinstance(field.default, list) else _config_apply_type(field.default, field)
-            elif field.optional is excluded or not field.optional:
-                raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-        else:
-            raise MetaInvalidTypeCommandError(f"Invalid field type command: {field_t}")
+        return _compile_type_command(field_t, field, default_is_same_type, apply_default)
     elif isinstance(field_t, dict):
-        for option_name in field_t.keys():
-            if option_name != "types":
-                raise MetaTypeBadOptionError(f"Type {TYPE_NAME_LIST} does not have option: {option_name}")
+        return None
+    return _compile_error(MetaTypeInvalidValueError, f"Type {tname} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
+
+def _compile_no_options(tname:str, field:MetaField, default_is_same_type:bool, apply_default:Validator)->Validator:
+    validate = _compile_common(tname, field, default_is_same_type, apply_default)
+    if validate is None:
+        return _compile_error(MetaTypeBadOptionError, f"Type {tname} does not have options.")
+    return validate
+
+_LENGTH_CHECKS:dict[str, Callable[[int, int], bool]] = {
+    ">": lambda l, o: l > o,
+    "<": lambda l, o: l < o,
+    ">=": lambda l, o: l >= o,
+    "<=": lambda l, o: l <= o
+}
+
+_NUMBER_CHECKS:dict[str, Callable[[int|float, int|float], bool]] = {
+    **_LENGTH_CHECKS,
+    "!=": lambda v, o: v != o
+}
+
+def _display_pattern(pattern:str)->str:
+    return re.sub(r"[\\]*?/", lambda m: f"{m[0][:-1]}\\/" if m[0].count("\\") % 2 == 0 else m[0], pattern).join("//")
+
+def _compile_str(field:MetaField, apply_default:Validator)->Validator:
+    validate = _compile_common(TYPE_NAME_STRING, field, isinstance(field.default, str), apply_default)
+    if validate is not None:
+        return validate
+    checks:list[Validator] = []
+    for option_name, option_value in field.types[TYPE_NAME_STRING].items():
+        if option_name in _LENGTH_CHECKS:
+            if not isinstance(option_value, int):
+                return _compile_error(MetaTypeBadOptionError, f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {int.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
+            def check(v:str, option_name=option_name, option_value=option_value, test=_LENGTH_CHECKS[option_name]):
+                if not test(len(v), option_value):
+                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: len({repr(v)}) {option_name} {option_value}")
+        elif option_name == "pattern":
+            if not isinstance(option_value, str):
+                return _compile_error(MetaTypeBadOptionError, f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {str.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
+            try:
+                pattern = re.compile(option_value)
+            except re.error as e:
+                return _compile_error(re.error, e.msg, e.pattern, e.pos)
+            def check(v:str, pattern=pattern, display=_display_pattern(option_value)):
+                if not pattern.fullmatch(v):
+                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"pattern\" not met: {repr(v)} matches {display}")
+        else:
+            return _compile_error(MetaTypeBadOptionError, f"Type {TYPE_NAME_STRING} does not have option: {option_name}")
+        checks.append(check)
+    return _compile_checks(checks)
+
+def _compile_number(T:type[int|float], tname:str, field:MetaField, apply_default:Validator)->Validator:
+    validate = _compile_common(tname, field, True, apply_default)
+    if validate is not None:
+        return validate
+    type_set_available = [float, int]
+    type_set = tuple(type_set_available[type_set_available.index(T):])
+    checks:list[Validator] = []
+    for option_name, option_value in field.types[tname].items():
+        if option_name not in _NUMBER_CHECKS:
+            return _compile_error(MetaTypeBadOptionError, f"Type {tname} does not have option: {option_name}")
+        elif not isinstance(option_value, type_set):
+            return _compile_error(MetaTypeBadOptionError, f"Type {tname} option \"{option_name}\" must speficy {" | ".join(t.__name__ for t in type_set)} value, got {type(option_value).__name__}: {repr(option_value)}")
+        def check(v:int|float, option_name=option_name, option_value=option_value, test=_NUMBER_CHECKS[option_name]):
+            if not test(v, option_value):
+                raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {v} {option_name} {option_value}")
+        checks.append(check)
+    return _compile_checks(checks)
+
+def _compile_checks(checks:list[Validator])->Validator:
+    if not checks:
+        return _validate_any
+    elif len(checks) == 1:
+        check, = checks
+        def validate(v):
+            check(v)
+            return v
+    else:
+        checks = tuple(checks)
+        def validate(v):
+            for check in checks:
+                check(v)
+            return v
+    return validate
+
+def _compile_object(field:MetaField, apply_default:Validator)->Validator:
+    #the "not allowed" messages have always named the boolean type here
+    field_t = field.types.get(TYPE_NAME_OBJECT, None)
+    if field_t is None or field_t is False:
+        return _compile_not_allowed(TYPE_NAME_BOOLEAN, field)
+    validate = _compile_common(TYPE_NAME_OBJECT, field, isinstance(field.default, dict), apply_default)
+    if validate is not None:
+        return validate
+    for option_name in field_t.keys():
+        if option_name != "fields" and option_name != "anyfield":
+            return _compile_error(MetaTypeBadOptionError, f"Type {TYPE_NAME_OBJECT} does not have option: {option_name}")
+    if len(field_t) > 1:
+        return _compile_error(MetaTypeBadOptionError, f"Type {TYPE_NAME_OBJECT} cannot specify both options: fields and anyfield")
+    elif "fields" in field_t:
+        return compile_fields(field_t["fields"])
+    elif "anyfield" in field_t:
+        validate_item = MetaField("", types=field_t["anyfield"]).validator
+        def validate(v:dict[str]):
+            fixed_object = {}
+            for k, item in v.items():
+                applied = validate_item(item)
+                if applied is not excluded:
+                    fixed_object[k] = applied
+            return fixed_object
+        return validate
+    return _compile_error(MetaTypeBadOptionError, "Either fields or anyfield option must be specified: neither was specified")
+
+def _compile_list(field:MetaField, apply_default:Validator)->Validator:
+    validate = _compile_common(TYPE_NAME_LIST, field, isinstance(field.default, list), apply_default)
+    if validate is not None:
+        return validate
+    field_t = field.types[TYPE_NAME_LIST]
+    for option_name in field_t.keys():
+        if option_name != "types":
+            return _compile_error(MetaTypeBadOptionError, f"Type {TYPE_NAME_LIST} does not have option: {option_name}")
+    validate_item = MetaField("", types=field_t["types"]).validator
+    def validate(v:list):
         fixed_list = []
-        vfield = MetaField("", types=field_t["types"])
         for item in v:
-            applied = _config_apply_type(item, vfield)
+            applied = validate_item(item)
             if applied is not excluded:
                 fixed_list.append(applied)
         return fixed_list
-    else:
-        raise MetaTypeInvalidValueError(f"Type {TYPE_NAME_LIST} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
-
-def _config_apply_str(v:str, field:MetaField):
-    field_t = field.types.get("string", None)
-    if field_t is None:
-        raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_STRING}\" not allowed for field {field.key}.")
-    elif isinstance(field_t, bool):
-        if field_t:
-            return v
-        else:
-            raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_STRING}\" not allowed for field {field.key}.")
-    elif isinstance(field_t, str):
-        if field_t == TYPE_COMMAND_EXCLUDE:
-            if field.default is not excluded:
-                return excluded if isinstance(field.default, str) else _config_apply_type(field.default, field)
-            elif field.optional is excluded or not field.optional:
-                raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-        else:
-            raise MetaInvalidTypeCommandError(f"Invalid field type command: {field_t}")
-    elif isinstance(field_t, dict):
-        l = len(v)
-        for option_name, option_value in field_t.items():
-            if option_name == ">":
-                if not isinstance(option_value, int):
-                    raise MetaTypeBadOptionError(f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {int.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif l <= option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: len({repr(v)}) > {option_value}")
-            elif option_name == "<":
-                if not isinstance(option_value, int):
-                    raise MetaTypeBadOptionError(f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {int.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif l >= option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: len({repr(v)}) < {option_value}")
-            elif option_name == ">=":
-                if not isinstance(option_value, int):
-                    raise MetaTypeBadOptionError(f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {int.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif l < option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: len({repr(v)}) >= {option_value}")
-            elif option_name == "<=":
-                if not isinstance(option_value, int):
-                    raise MetaTypeBadOptionError(f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {int.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif l > option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: len({repr(v)}) <= {option_value}")
-            elif option_name == "pattern":
-                if not isinstance(option_value, str):
-                    raise MetaTypeBadOptionError(f"Type {TYPE_NAME_STRING} option \"{option_name}\" must speficy {str.__name__} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif not re.fullmatch(option_value, v):
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {repr(v)} matches {re.sub(r"[\\]*?/", lambda m: f"{m[0][:-1]}\\/" if m[0].count("\\") % 2 == 0 else m[0], option_value).join("//")}")
-            else:
-                raise MetaTypeBadOptionError(f"Type {TYPE_NAME_STRING} does not have option: {option_name}")
-        return v
-    else:
-        raise MetaTypeInvalidValueError(f"Type {TYPE_NAME_STRING} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
-
-def _config_apply_number(v:int|float, T:type[int|float], tname:str, field:MetaField):
-    field_t = field.types.get(tname, None)
-    if field_t is None:
-        raise MetaTypeInvalidException(f"Type \"{tname}\" not allowed for field {field.key}.")
-    elif isinstance(field_t, bool):
-        if field_t:
-            return v
-        else:
-            raise MetaTypeInvalidException(f"Type \"{tname}\" not allowed for field {field.key}.")
-    elif isinstance(field_t, str):
-        if field_t == TYPE_COMMAND_EXCLUDE:
-            if field.default is not excluded:
-                return excluded if isinstance(v, T) else _config_apply_type(field.default, field)
-            elif field.optional is excluded or not field.optional:
-                raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-        else:
-            raise MetaInvalidTypeCommandError(f"Invalid field type command: {field_t}")
-    elif isinstance(field_t, dict):
-        type_set_available = [float, int]
-        type_set = tuple(type_set_available[type_set_available.index(T):])
-        for option_name, option_value in field_t.items():
-            if option_name == ">":
-                if not isinstance(option_value, type_set):
-                    raise MetaTypeBadOptionError(f"Type {tname} option \"{option_name}\" must speficy {" | ".join(t.__name__ for t in type_set)} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif v <= option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {v} > {option_value}")
-            elif option_name == "<":
-                if not isinstance(option_value, type_set):
-                    raise MetaTypeBadOptionError(f"Type {tname} option \"{option_name}\" must speficy {" | ".join(t.__name__ for t in type_set)} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif v >= option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {v} < {option_value}")
-            elif option_name == ">=":
-                if not isinstance(option_value, type_set):
-                    raise MetaTypeBadOptionError(f"Type {tname} option \"{option_name}\" must speficy {" | ".join(t.__name__ for t in type_set)} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif v < option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {v} >= {option_value}")
-            elif option_name == "<=":
-                if not isinstance(option_value, type_set):
-                    raise MetaTypeBadOptionError(f"Type {tname} option \"{option_name}\" must speficy {" | ".join(t.__name__ for t in type_set)} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif v > option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {v} <= {option_value}")
-            elif option_name == "!=":
-                if not isinstance(option_value, type_set):
-                    raise MetaTypeBadOptionError(f"Type {tname} option \"{option_name}\" must speficy {" | ".join(t.__name__ for t in type_set)} value, got {type(option_value).__name__}: {repr(option_value)}")
-                elif v == option_value:
-                    raise ConfigRequirementNotMetException(f"Requirement for {field.key} from option \"{option_name}\" not met: {v} != {option_value}")
-
-            else:
-                raise MetaTypeBadOptionError(f"Type {tname} does not have option: {option_name}")
-        return v
-    else:
-        raise MetaTypeInvalidValueError(f"Type {tname} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
-
-def _config_apply_type(v, field:MetaField):
+    return validate
+
+_KIND_ORDER:tuple[tuple[type, str], ...] = (
+    (type(None), TYPE_NAME_NULL),
+    (str, TYPE_NAME_STRING),
+    (bool, TYPE_NAME_BOOLEAN),
+    (int, TYPE_NAME_INTEGER),
+    (float, TYPE_NAME_FLOAT),
+    (dict, TYPE_NAME_OBJECT),
+    (list, TYPE_NAME_LIST)
+)
+_KINDS:dict[type, str] = {**dict(_KIND_ORDER), config.FrozenDict: TYPE_NAME_OBJECT, config.FrozenList: TYPE_NAME_LIST}
+
+def _kind_of(v)->str:
+    kind = _KINDS.get(type(v), None)
+    if kind is None:
+        for T, kind in _KIND_ORDER:
+            if isinstance(v, T):
+                return kind
+        raise ConfigMetaException(f"Value of unsupported type {type(v).__name__}: {v}")
+    return kind
+
+def compile_field(field:MetaField)->Validator:
+    """Turns the field's type expressions into a function that validates a value and applies defaults to it."""
     if field.types is excluded:
-        return v
-    else:
-        if v is None:
-            field_t = field.types.get(TYPE_NAME_NULL, None)
-            if field_t is None:
-                raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_NULL}\" not allowed for field {field.key}.")
-            elif isinstance(field_t, bool):
-                if field_t:
-                    return v
-                else:
-                    raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_NULL}\" not allowed for field {field.key}.")
-            elif isinstance(field_t, str):
-                if field_t == TYPE_COMMAND_EXCLUDE:
-                    if field.default is not excluded:
-                        return excluded if field.default is None else _config_apply_type(field.default, field)
-                    elif field.optional is excluded or not field.optional:
-                        raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-                else:
-                    raise MetaInvalidTypeCommandError(f"Invalid field type command: {field_t}")
-            elif isinstance(field_t, dict):
-                raise MetaTypeBadOptionError(f"Type {TYPE_NAME_NULL} does not have options.")
-            else:
-                raise MetaTypeInvalidValueError(f"Type {TYPE_NAME_NULL} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
-        elif isinstance(v, str):
-            return _config_apply_str(v, field)
-        elif isinstance(v, bool):
-            field_t = field.types.get(TYPE_NAME_BOOLEAN, None)
-            if field_t is None:
-                raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_BOOLEAN}\" not allowed for field {field.key}.")
-            elif isinstance(field_t, bool):
-                if field_t:
-                    return v
-                else:
-                    raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_BOOLEAN}\" not allowed for field {field.key}.")
-            elif isinstance(field_t, str):
-                if field_t == TYPE_COMMAND_EXCLUDE:
-                    if field.default is not excluded:
-                        return excluded if isinstance(field.default, bool) else _config_apply_type(field.default, field)
-                    elif field.optional is excluded or not field.optional:
-                        raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-                else:
-                    raise MetaInvalidTypeCommandError(f"Invalid field type command: {field_t}")
-            elif isinstance(field_t, dict):
-                raise MetaTypeBadOptionError(f"Type {TYPE_NAME_BOOLEAN} does not have options.")
-            else:
-                raise MetaTypeInvalidValueError(f"Type {TYPE_NAME_BOOLEAN} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
-        elif isinstance(v, int):
-            return _config_apply_number(v, int, TYPE_NAME_INTEGER, field)
-        elif isinstance(v, float):
-            return _config_apply_number(v, float, TYPE_NAME_FLOAT, field)
-        elif isinstance(v, dict):
-            field_t = field.types.get(TYPE_NAME_OBJECT, None)
-            if field_t is None:
-                raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_BOOLEAN}\" not allowed for field {field.key}.")
-            elif isinstance(field_t, bool):
-                if field_t:
-                    return v
-                else:
-                    raise MetaTypeInvalidException(f"Type \"{TYPE_NAME_BOOLEAN}\" not allowed for field {field.key}.")
-            elif isinstance(field_t, str):
-                if field_t == TYPE_COMMAND_EXCLUDE:
-                    if field.default is not excluded:
-                        return excluded if isinstance(field.default, dict) else _config_apply_type(field.default, field)
-                    elif field.optional is excluded or not field.optional:
-                        raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-                else:
-                    raise MetaInvalidTypeCommandError(f"Invalid field type command: {field_t}")
-            elif isinstance(field_t, dict):
-                has = 0
-                for option_name in field_t.keys():
-                    if option_name != "fields" and option_name != "anyfield":
-                        raise MetaTypeBadOptionError(f"Type {TYPE_NAME_OBJECT} does not have option: {option_name}")
-                    else:
-                        has += 1
-                if has > 1:
-                    raise MetaTypeBadOptionError(f"Type {TYPE_NAME_OBJECT} cannot specify both options: fields and anyfield")
-                elif "fields" in field_t:
-                    return config_apply_meta(v, field_t["fields"])
-                else: #"anyfield" in field_t
-                    fixed_object= {}
-                    vfield = MetaField("", types=field_t["anyfield"])
-                    for k,item in v.items():
-                        applied = _config_apply_type(item, vfield)
-                        if applied is not excluded:
-                            fixed_object[k] = applied
-                    return fixed_object
-            else:
-                raise MetaTypeInvalidValueError(f"Type {TYPE_NAME_OBJECT} must be specified by {bool.__name__}, {str.__name__}, or {dict.__name__}, got {type(field_t).__name__}: {repr(field_t)}.")
-        elif isinstance(v, list):
-            return _config_apply_meta_list(v, field)
-        else:
-            raise ConfigMetaException(f"Value of unsupported type {type(v).__name__}: {v}")
-
+        return _validate_any
+
+    def validate(v):
+        handler = by_type.get(type(v), None)
+        if handler is None:
+            handler = handlers[_kind_of(v)]
+        return handler(v)
+
+    def apply_default(_):
+        return validate(field.default)
+
+    handlers:dict[str, Validator] = {
+        TYPE_NAME_NULL: _compile_no_options(TYPE_NAME_NULL, field, field.default is None, apply_default),
+        TYPE_NAME_STRING: _compile_str(field, apply_default),
+        TYPE_NAME_BOOLEAN: _compile_no_options(TYPE_NAME_BOOLEAN, field, isinstance(field.default, bool), apply_default),
+        TYPE_NAME_INTEGER: _compile_number(int, TYPE_NAME_INTEGER, field, apply_default),
+        TYPE_NAME_FLOAT: _compile_number(float, TYPE_NAME_FLOAT, field, apply_default),
+        TYPE_NAME_OBJECT: _compile_object(field, apply_default),
+        TYPE_NAME_LIST: _compile_list(field, apply_default)
+    }
+    by_type = {T:handlers[kind] for T, kind in _KINDS.items()}
+    return validate
+
+def compile_fields(fields:MetaFieldCollection)->Validator:
+    """Turns a collection of fields into a function that validates a config object and applies defaults to it."""
+    entries = tuple((name, field.validator, field.default, field.optional is excluded or not field.optional, field.key) for name, field in fields.items())
+
+    def validate(c:dict[str])->dict[str]:
+        fixed_c = {}
+        for name, validate_field, default, required, key in entries:
+            if name in c:
+                applied = validate_field(c[name])
+                if applied is not excluded:
+                    fixed_c[name] = applied
+            elif default is not excluded:
+                fixed_c[name] = default
+            elif required:
+                raise ConfigMissingMetaFieldException(f"Missing field {key}.")
+
+        #add names from config file that aren't in meta
+        for name, v in c.items():
+            if name not in fields:
+                fixed_c[name] = v
+
+        return fixed_c
+    return validate
 
 def config_apply_meta(c:dict[str], fields:MetaFieldCollection)->dict[str]:
-    fixed_c = {}
-    for name, field in fields.items():
-        if name in c:
-            v = c[name]
-            applied = _config_apply_type(v, field)
-            if applied is not excluded:
-                fixed_c[name] = applied
-        elif field.default is not excluded:
-            fixed_c[name] = field.default
-        elif field.optional is excluded or not field.optional:
-            raise ConfigMissingMetaFieldException(f"Missing field {field.key}.")
-
-    #add names from config file that aren't in meta
-    for name in (set(c.keys()) - set(fields.keys())):
-        fixed_c[name] = c[name]
-
-    return fixed_c
-
-def read_configs(path:str, meta:Meta):
-    c = config.read(path)
-    if meta.configs is not excluded:
-        return config_apply_meta(c, meta.configs)
+    return compile_fields(fields)(c)
+
+_validated_configs:weakref.WeakKeyDictionary[Meta, dict[str, tuple[int, config.FrozenDict]]] = weakref.WeakKeyDictionary()
+
+def read_configs(path:str, meta:Meta)->config.FrozenDict:
+    """Reads the config file with the plugin's metadata applied. Results are cached until the file's version changes or the Meta object goes away."""
+    snapshot = config.get_snapshot(path)
+    if meta.configs is excluded:
+        return snapshot.contents
+    by_path = _validated_configs.get(meta, None)
+    if by_path is None:
+        by_path = _validated_configs[meta] = {}
+    cached = by_path.get(path, None)
+    if cached is not None and cached[0] == snapshot.version:
+        return cached[1]
+    c = config.freeze(meta.apply(snapshot.contents))
+    by_path[path] = snapshot.version, c
     return c
 
 def read_plugin_meta(path:str)->Meta:
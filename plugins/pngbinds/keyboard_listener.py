@@ -1,14 +1,18 @@
 from datetime import datetime, timezone
 import json
+import os
 import pynput
 import re
 import statemapping
 import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #for eventcodec
+import eventcodec
 import threading
 import time
 from typing import Callable
 from uuid import UUID, uuid4
 import websocket
+import zlib
 
 KEYBIND_PATTERN = re.compile(r"[ ]*((?:(?:[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*|\([ ]*[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*\)[ ]*)|(?:\([ ]*[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*(?:\+[ ]*[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*)\)[ ]*))(?:\+[ ]*(?:(?:[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*|\([ ]*[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*\)[ ]*)|(?:\([ ]*[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*(?:\+[ ]*[',\-./0-9;=A-Z\[\\\]`a-z][ ',\-./0-9;=A-Z\[\\\]`a-z]*)\)[ ]*)))*)(?:\+[ ]*)*")
 KEYBIND_SPLIT_PATTERN = re.compile(r"\+(?![^()]*\))")
@@ -574,9 +578,9 @@ def on_open(ws:websocket.WebSocket):
 def on_message(ws:websocket.WebSocket, msg):
     if isinstance(msg, (str, bytes)):
         try:
-            data = json.loads(msg)
-        except json.JSONDecodeError:
-            print("pngbinds:\tclient received invalid JSON:", msg)
+            data = eventcodec.decode(msg)
+        except (ValueError, zlib.error):
+            print("pngbinds:\tclient received invalid message:", msg)
         else:
             if isinstance(data, dict) and isinstance((event_name := data.get("name", None)), str):
                 handle_socket_event(event_name, data.get("data"))
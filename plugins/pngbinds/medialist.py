@@ -1,19 +1,25 @@
 import datafile
-import json
-import os
+import datastore
 
 MEDIA_DIR = datafile.makepath("pngbinds-media")
 MEDIA_LIST_PATH = datafile.makepath("pngbinds_media.json")
 
 MediaList = dict[str, dict[str]]
 
+media_store = datastore.table("pngbinds_media", MEDIA_LIST_PATH)
+
 def load_media_list(path=MEDIA_LIST_PATH)->MediaList:
-    if os.path.isfile(path):
-        with open(path) as f:
-            return json.load(f)
-    return {}
+    return media_store.load(path)
     
 def save_media_list(mlist:MediaList, path=MEDIA_LIST_PATH):
-    with open(path, "w") as f:
-        json.dump(mlist, f, indent="    ")
+    media_store.save(mlist, path)
+
+def load_media(name:str, path=MEDIA_LIST_PATH)->dict[str]|None:
+    return media_store.get(name, path)
+
+def save_media(name:str, entry:dict[str], path=MEDIA_LIST_PATH):
+    media_store.put(name, entry, path)
+
+def delete_media(name:str, path=MEDIA_LIST_PATH)->bool:
+    return media_store.delete(name, path)
     
\ No newline at end of file
@@ -1,4 +1,5 @@
 from . import medialist, statemapping, webroutes
+import eventcodec
 import events
 import os
 import plugins
@@ -22,7 +23,9 @@ microphone_read_thread:threading.Thread = None
 
 def run_keyboard_listener(api_host_address:str, secure_api:bool=False):
     s = "s" * secure_api
-    return subprocess.Popen([sys.executable, KEYBOARD_LISTENER_FILE, f"ws{s}://{api_host_address}/api/pngbinds/events"])
+    #statemap updates can be large, so they're compressed
+    encodings = eventcodec.preferred_encodings() or eventcodec.ENCODING_JSON
+    return subprocess.Popen([sys.executable, KEYBOARD_LISTENER_FILE, f"ws{s}://{api_host_address}/api/pngbinds/events?encoding={encodings}&deflate=1"])
 
 #can be overriden
 def create_navigator(statemap:statemapping.StateMap, default_state:str,
@@ -104,7 +104,7 @@ function bufferedDisplayState(info) {
 window.addEventListener("load", async () => {
     [mlist, statemap] = await Promise.all([getMediaList(), getStatemap()]);
     preloadAssets(); //allows for media to be changed ASAP
-    const events = new WebSocket("/api/events");
+    const events = new WebSocket("/api/events?topics=pngbinds:state_change");
 
     events.addEventListener("open", async () => {
         const r = await fetch("/api/pngbinds/state/current");
@@ -1,18 +1,20 @@
 from . import medialist, statemapping
+from concurrent.futures import ThreadPoolExecutor
 import config
 import datafile
 from datetime import datetime, timedelta, timezone
+import eventcodec
 import events
 from flask import Blueprint, Flask, render_template, request, send_file
 from flask_sock import Server
-import json
 import os
 import plugins
 import shutil
 import threading
 import traceback
-from web import add_bp_if_new, serve_when_loaded, sock
+from web import add_bp_if_new, get_event_codec, saved_response, send_data_file, send_event, serve_when_loaded, sock
 from werkzeug.security import safe_join
+import zlib
 
 DIR = os.path.dirname(__file__)
 STATIC_DIR = os.path.join(DIR, "static")
@@ -30,7 +32,8 @@ statemap:statemapping.StateMap = None
 event_negotiator:statemapping.EventNegotiator = None
 event_negotiator_thread:threading.Thread = None
 keyevents = events.EventBucketContainer()
-keylisteners = events.EventListenerCollection()
+#one worker, so blocking listeners still handle the key events in order
+keylisteners = events.EventListenerCollection(executor=ThreadPoolExecutor(1, "pngbinds listener"))
 last_statemap_send = datetime.now()
 
 def _get_state_data(frame:statemapping.NavigatorStackFrame|None)->dict[str]:
@@ -51,7 +54,7 @@ def _get_state_data(frame:statemapping.NavigatorStackFrame|None)->dict[str]:
     return {"name": data_name, "media": data_media}
 
 def dispatch_state_change_event():
-    events.dispatch(events.Event("pngbinds:state_change", _get_state_data(nav_stack)))
+    events.dispatch(events.Event("pngbinds:state_change", _get_state_data(nav_stack), key="pngbinds:state_change"))
 
 def get_config_default_state(meta:plugins.Meta)->str|None:
     config_parent = plugins.read_configs(config.CONFIG_FILE, meta)
@@ -61,9 +64,9 @@ def get_config_default_state(meta:plugins.Meta)->str|None:
     return None
 
 def load_statemap():
-    if os.path.isfile(STATEMAP_FILE):
-        with open(STATEMAP_FILE) as f:
-            return statemapping.StateMap.load(f)
+    text = datafile.read_text(STATEMAP_FILE)
+    if text is not None:
+        return statemapping.StateMap.loads(text)
     return statemapping.StateMap()
 
 def send_statemap(statemap:statemapping.StateMapNavigator=None):
@@ -74,9 +77,9 @@ def send_statemap(statemap:statemapping.StateMapNavigator=None):
     last_statemap_send = now
     if statemap is None:
         statemap = load_statemap()
-    keyevents.dispatch(events.Event("statemap_update", {"statemap": statemap.__getstate__()}))
+    keyevents.dispatch(events.Event("statemap_update", {"statemap": statemap.__getstate__()}, key="statemap_update"))
 
-@keylisteners.listener("stack_update")
+@keylisteners.listener("stack_update", blocking=True) #reads the statemap file, so it doesn't hold up the /events socket
 def event_stack_update(event:events.Event):
     global nav_stack
     frames = event.data["stack"]
@@ -120,11 +123,10 @@ def statemap_file():
         except (KeyError, TypeError, AttributeError) as e:
             traceback.print_exception(e)
             return "", 422
-        with open(STATEMAP_FILE, "w") as f:
-            statemap.dump(f, indent="    ")
-        return "", 200
-    elif os.path.isfile(STATEMAP_FILE):
-        return send_file(STATEMAP_FILE)
+        datafile.write_text(STATEMAP_FILE, statemap.dumps(indent="    "))
+        return saved_response(STATEMAP_FILE)
+    elif datafile.writer.is_pending(STATEMAP_FILE) or os.path.isfile(STATEMAP_FILE):
+        return send_data_file(STATEMAP_FILE)
     else:
         return {}
 
@@ -155,29 +157,25 @@ def get_media_file(name:str):
             "type": mtype
         }
 
-        mlist = medialist.load_media_list()
-        if name in mlist:
-            mlist[name].update(entry)
-        else:
-            mlist[name] = entry
-        medialist.save_media_list(mlist)
-        return "", 200
+        m = medialist.load_media(name)
+        if m is not None:
+            m.update(entry)
+            entry = m
+        medialist.save_media(name, entry)
+        return saved_response(medialist.MEDIA_LIST_PATH)
     elif request.method == "DELETE":
-        mlist = medialist.load_media_list()
-        entry = mlist.get(name, None)
+        entry = medialist.load_media(name)
         if entry is not None:
             mtype = entry.get("type", None)
             value = entry.get("value", None)
             if mtype == "image":
                 if value is not None and os.path.isfile(value):
                     os.remove(value)
-            del mlist[name]
-            medialist.save_media_list(mlist)
-            return "", 200
+            medialist.delete_media(name)
+            return saved_response(medialist.MEDIA_LIST_PATH)
         return "", 404
     else:
-        mlist = medialist.load_media_list()
-        m = mlist.get(name, None)
+        m = medialist.load_media(name)
         if m is not None:
             mtype = m.get("type", None)
             if mtype == "image":
@@ -190,10 +188,9 @@ def get_media_file(name:str):
     
 @pngbindsapi.route("/media/file/<name>/bounds", methods=["POST", "DELETE"])
 def set_media_file_bounds(name:str):
-    mlist = medialist.load_media_list()
-    if name not in mlist:
+    m = medialist.load_media(name)
+    if m is None:
         return "", 404
-    m = mlist[name]
     if request.method == "POST":
         bounds = {}
         for k in ["top", "right", "bottom", "left"]:
@@ -206,14 +203,14 @@ def set_media_file_bounds(name:str):
                 return "Bounds must be integers", 422
         if bounds:
             m["bounds"] = bounds
-            medialist.save_media_list(mlist)
-            return "", 200
+            medialist.save_media(name, m)
+            return saved_response(medialist.MEDIA_LIST_PATH)
         else:
             return "No bounds specified", 422
     else:
         m.pop("bounds", None)
-        medialist.save_media_list(mlist)
-        return "", 200
+        medialist.save_media(name, m)
+        return saved_response(medialist.MEDIA_LIST_PATH)
 
 @sock.route("/events", bp=pngbindsapi)
 @serve_when_loaded(web_loaded_callback)
@@ -224,29 +221,32 @@ def keybinds_events(ws:Server):
         ws.close(418)
         return #one connection at a time
     bucket = keyevents.new_bucket()
+    codec, deflate = get_event_codec()
 
     statemap = load_statemap()
     
     #init event
-    ws.send(events.Event("nav_init", {
+    send_event(ws, events.Event("nav_init", {
         "statemap": statemap.__getstate__(),
         "default_state": get_config_default_state(meta)
-    }).to_json())
+    }), codec, deflate)
 
     try:
         while ws.connected:
             msg = ws.receive(0.001)
             if isinstance(msg, (str, bytes)):
                 try:
-                    data = json.loads(msg)
-                except json.JSONDecodeError:
-                    print("pngbinds:\tapi /events message invalid json:", msg)
+                    data = eventcodec.decode(msg)
+                except (ValueError, zlib.error):
+                    print("pngbinds:\tapi /events message invalid:", msg)
                 else:
                     if isinstance(data, dict) and isinstance((event_name := data.get("name", None)), str):
                         event = events.Event(event_name, data.get("data"))
                         keylisteners.handle_event(event)
             for event in bucket.dump():
-                ws.send(event.to_json())
+                send_event(ws, event, codec, deflate)
+            if bucket.closed:
+                break
     except KeyboardInterrupt:
         pass
     finally:
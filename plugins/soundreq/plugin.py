@@ -21,7 +21,7 @@ player:soundplayer.SoundRequestPlayer = None
 def on_load(ctx:plugins.LoadEvent):
     global playerprocess, player
     
-    soundrequesting.meta = ctx.plugin.meta
+    soundrequesting.set_meta(ctx.plugin.meta)
     webroutes.web_loaded = True
     
     m_api = ctx.plugin.get_component_mode(COMPONENT_API)
@@ -1,4 +1,4 @@
-import json
+import eventcodec
 import requests
 import time
 import traceback
@@ -13,6 +13,8 @@ class SoundRequestPlayer:
         self.api_secure = api_secure
         self.output_device = output_device
         self.wsa:websocket.WebSocketApp = None
+        self.last_seq:int|None = None
+        self._end_attached = False
     
     def load_sound(self, key:str):
         s = "s"*self.api_secure
@@ -57,8 +59,10 @@ class SoundRequestPlayer:
             device, _ = self.get_device(self.output_device)
             if device is not None:
                 vlc.libvlc_audio_output_device_set(self.vlc_player, None, device)
-        event_manager:vlc.EventManager = self.vlc_player.event_manager()
-        event_manager.event_attach(vlc.EventType.MediaPlayerEndReached, self._end_reached)
+        if not self._end_attached:
+            event_manager:vlc.EventManager = self.vlc_player.event_manager()
+            event_manager.event_attach(vlc.EventType.MediaPlayerEndReached, self._end_reached)
+            self._end_attached = True
 
     def ws_on_close(self, ws:websocket.WebSocket, status_code:int, msg:str|bytearray|memoryview):
         print(f"Sound request player connection closed ({status_code}):", msg)
@@ -66,9 +70,13 @@ class SoundRequestPlayer:
     def ws_on_message(self, ws:websocket.WebSocket, msg:str|bytearray|memoryview):
         if isinstance(msg, memoryview):
             msg = msg.tobytes()
-        data = json.loads(msg)
+        data = eventcodec.decode(msg)
         if not isinstance(data, dict):
             return
+        seq = data.get("seq", None)
+        if isinstance(seq, int):
+            self.last_seq = seq
+            ws.url = self.events_url()
         name = data.get("name", None)
         event = data.get("data", None)
         if not isinstance(event, dict):
@@ -79,11 +87,18 @@ class SoundRequestPlayer:
     def ws_on_error(self, ws:websocket.WebSocket, e:Exception):
         traceback.print_exception(e)
 
-    def start(self):
+    def events_url(self):
         s = "s"*self.api_secure
-        self.wsa = websocket.WebSocketApp(f"ws{s}://{self.api_url_host}/api/events", on_open=self.ws_on_open, on_close=self.ws_on_close, on_message=self.ws_on_message, on_error=self.ws_on_error)
+        since = "" if self.last_seq is None else f"&since={self.last_seq}"
+        encodings = eventcodec.preferred_encodings()
+        encoding = "" if encodings is None else f"&encoding={encodings}"
+        return f"ws{s}://{self.api_url_host}/api/events?topics=soundreq:play_sound{since}{encoding}"
+
+    def start(self):
+        self.wsa = websocket.WebSocketApp(self.events_url(), on_open=self.ws_on_open, on_close=self.ws_on_close, on_message=self.ws_on_message, on_error=self.ws_on_error)
         try:
-            self.wsa.run_forever()
+            #sound requests made while reconnecting are resumed from the last one played
+            self.wsa.run_forever(reconnect=5)
         except KeyboardInterrupt:
             pass
 
@@ -96,4 +111,5 @@ class SoundRequestPlayer:
             if self.vlc_player.is_playing():
                 self.vlc_player.pause()
             self.vlc_player.set_media(None)
-            self.vlc_player = None
\ No newline at end of file
+            self.vlc_player = None
+            self._end_attached = False
\ No newline at end of file
@@ -1,5 +1,7 @@
-import soundplayer
+import os
 import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")) #for eventcodec
+import soundplayer
 
 if __name__ == "__main__":
     addr = sys.argv[1]
@@ -9,6 +9,8 @@ queue:list[tuple[str, str|None, str|None]] = []
 queue_handler:threading.Thread = None
 sound_done = threading.Event()
 
+CONFIG_SECTION = "Sound-Request"
+
 meta:plugins.Meta = None
 
 def get_configs():
@@ -16,12 +18,27 @@ def get_configs():
         return config.read(path=config.CONFIG_FILE)
     return plugins.read_configs(path=config.CONFIG_FILE, meta=meta)
 
+def _index_sounds(section:dict[str]|None)->dict[str, dict[str]]:
+    #only the Sound-Request section is validated, so changes to other sections don't rebuild the index
+    if section is None:
+        return config.FrozenDict()
+    if meta is not None and meta.configs is not plugins.excluded and CONFIG_SECTION in meta.configs:
+        section = meta.configs[CONFIG_SECTION].validator(section)
+    sounds = section.get("Sounds", None) if isinstance(section, dict) else None
+    return config.freeze(sounds) if isinstance(sounds, dict) else config.FrozenDict()
+
+sound_index = config.section(CONFIG_SECTION).derive(_index_sounds)
+
+def set_meta(m:plugins.Meta|None):
+    global meta
+    meta = m
+    sound_index.invalidate()
+
+def get_sound_list()->dict[str, dict[str]]:
+    return sound_index.get()
+
 def get_sound(key:str)->dict[str]|None:
-    config_parent = get_configs()
-    configs:dict = config_parent.get("Sound-Request", {})
-    if "Sounds" in configs:
-        sounds:dict[str] = configs["Sounds"]
-        return sounds.get(key, None)
+    return sound_index.get().get(key, None)
 
 def add_queue(key:str, user:str|None=None, channel:str|None=None):
     with queue_lock:
@@ -23,13 +23,7 @@ def get_sound(key:str):
 @soundreqapi.get("/list")
 @serve_when_loaded(web_loaded_callback)
 def get_sound_list():
-    config_parent = soundrequesting.get_configs()
-    configs:dict = config_parent.get("Sound-Request", {})
-    if "Sounds" in configs:
-        sounds = configs["Sounds"]
-        if isinstance(sounds, dict):
-            return sounds, 200
-    return {}, 200
+    return soundrequesting.get_sound_list(), 200
 
 @soundreqapi.post("request")
 @serve_when_loaded(web_loaded_callback)
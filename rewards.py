@@ -1,7 +1,6 @@
 import actions
 import datafile
-import json
-import os
+import datastore
 from tronix import script, utils
 import tronix_twitch_integrations as tti
 import twitchio
@@ -13,6 +12,8 @@ IDEN_TYPE_TITLE = "title"
 
 REDEEM_HANDLERS_PATH = datafile.makepath("redeem_handlers.json")
 
+redeem_handler_store = datastore.table("redeem_handlers", REDEEM_HANDLERS_PATH)
+
 RedeemHandlerCallback = Callable[[commands.Bot, twitchio.ChannelPointsRedemptionAdd], Any]
 
 class RewardIdentifier:
@@ -83,15 +84,14 @@ class ActionRedeemHandler(RedeemHandler):
         self.action_mapping = action_mapping
 
     def handle(self, bot:commands.Bot, payload:twitchio.ChannelPointsRedemptionAdd):
-        action = actions.load_action_table().get(self.action_name, None)
+        action = actions.lookup_action(self.action_name)
         if action is None:
             ... #TODO exception unknown action
         script_scope = {"twitch_context": script.ScriptVariable(utils.wrap_python_value(tti.BotScriptContext(bot, redeem_payload=payload)))}
         if self.action_mapping is not None:
             filled_values = self.action_mapping.fill_values(payload.user_input)
             script_scope.update(action.collect_script_values(filled_values))
-        s = script.Script(action.script, script_scope)
-        return actions.script_runner.run_async(s)
+        return actions.script_runner.run_async(actions.script_cache.get(action.script, script_scope))
     
 
 class CallbackRedeemHandler(RedeemHandler):
@@ -120,20 +120,23 @@ class CallbackRedeemHandler(RedeemHandler):
     def __call__(self, bot:commands.Bot, payload:twitchio.ChannelPointsRedemptionAdd):
         return self.handle(bot, payload)
     
+def _redeem_handler_from_state(d:dict[str])->ActionRedeemHandler:
+    rh = ActionRedeemHandler.__new__(ActionRedeemHandler)
+    rh.__setstate__(d)
+    return rh
+
 def load_redeem_handlers(path:str=None)->dict[str,ActionRedeemHandler]:
-    if path is None:
-        path = REDEEM_HANDLERS_PATH
-    if not os.path.isfile(path):
-        return {}
-    with open(path) as f:
-        d:dict[str, dict[str]] = json.load(f)
-    rtv = {}
-    for k,v in d.items():
-        rtv[RewardIdentifier.from_str(k)] = rh = ActionRedeemHandler.__new__(ActionRedeemHandler)
-        rh.__setstate__(v)
-    return rtv
+    return {RewardIdentifier.from_str(k):_redeem_handler_from_state(v) for k,v in redeem_handler_store.load(path).items()}
 
 def save_redeem_handlers(redeem_handlers:dict[str,ActionRedeemHandler], path:str=None):
-    c = json.dumps({str(rh.identifier):rh.__getstate__() for rh in redeem_handlers.values() if isinstance(rh, ActionRedeemHandler)}, indent=4)
-    with open(REDEEM_HANDLERS_PATH if path is None else path, "w") as f:
-        f.write(c)
+    redeem_handler_store.save({str(rh.identifier):rh.__getstate__() for rh in redeem_handlers.values() if isinstance(rh, ActionRedeemHandler)}, path)
+
+def load_redeem_handler(identifier:RewardIdentifier, path:str=None)->ActionRedeemHandler|None:
+    d = redeem_handler_store.get(str(identifier), path)
+    return None if d is None else _redeem_handler_from_state(d)
+
+def save_redeem_handler(redeem_handler:ActionRedeemHandler, path:str=None):
+    redeem_handler_store.put(str(redeem_handler.identifier), redeem_handler.__getstate__(), path)
+
+def delete_redeem_handler(identifier:RewardIdentifier, path:str=None)->bool:
+    return redeem_handler_store.delete(str(identifier), path)
@@ -107,6 +107,25 @@ function putConfigs(configs) {
     });
 }
 
+/**
+ * Waits for a queued write of a data file to finish.
+ * @param {string} name File name in the data directory.
+ * @returns {Promise<string?>} Why the write failed, or null if it succeeded.
+ */
+async function waitSaved(name) {
+    while (true) {
+        const r = await fetch(`/api/datafile/status?name=${encodeURIComponent(name)}`);
+        if (!r.ok)
+            return null;
+        const status = await r.json();
+        if (status.error != null)
+            return status.error;
+        if (!status.pending)
+            return null;
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+}
+
 /**
  * @param {ConfigMetaCollection} metas 
  * @returns {[MetaFieldGrouping, Map<string, string>]} A MetaFieldGrouping and a field key to plugin map.
@@ -970,9 +989,14 @@ window.addEventListener("load", async () => {
             }
         });
         if (isValid) {
-            putConfigs(configs).then(r => {
+            putConfigs(configs).then(async r => {
                 if (!r.ok) {
                     alert("Failed to save configs");
+                    return;
+                }
+                const error = await waitSaved("config.json");
+                if (error != null) {
+                    alert(`Failed to save configs: ${error}`);
                 }
             });
 
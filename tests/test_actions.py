@@ -0,0 +1,79 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import pickle
+import pytest
+import threading
+
+tronix = pytest.importorskip("tronix")
+import actions
+
+SCRIPT = 'print("cached")\n'
+
+@pytest.fixture
+def runner():
+    return tronix.utils.ScriptRunner()
+
+def snapshot(value):
+    try:
+        return pickle.dumps(value)
+    except Exception:
+        return repr(value)
+
+def test_prepare_is_cached():
+    cache = actions.ScriptCache()
+    state = cache.prepare(SCRIPT)
+    assert cache.prepare(SCRIPT) is state
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_evicts_least_recently_used():
+    cache = actions.ScriptCache(maxsize=2)
+    first = cache.prepare('print("a")\n')
+    cache.prepare('print("b")\n')
+    cache.prepare('print("a")\n')
+    cache.prepare('print("c")\n')
+    assert len(cache) == 2 and cache.evictions == 1
+    assert cache.prepare('print("a")\n') is first
+
+def test_runs_twice(runner):
+    cache = actions.ScriptCache()
+    first = cache.get(SCRIPT, {})
+    second = cache.get(SCRIPT, {})
+    assert first is not second and first.scope is not second.scope
+    asyncio.run(runner.run_async(first))
+    asyncio.run(runner.run_async(second))
+    assert cache.hits == 1 and cache.misses == 1
+
+def test_runs_concurrently(runner):
+    cache = actions.ScriptCache()
+    scripts = [cache.get(SCRIPT, {}) for _ in range(8)]
+
+    async def run_all():
+        await asyncio.gather(*(runner.run_async(s) for s in scripts))
+    asyncio.run(run_all())
+
+    errors = []
+    def run_in_thread():
+        try:
+            asyncio.run(runner.run_async(cache.get(SCRIPT, {})))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run_in_thread) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert cache.misses == 1
+
+def test_runs_dont_change_shared_state(runner):
+    #fails if running changes anything the runs share, which would then be per-run state leaking between runs
+    cache = actions.ScriptCache()
+    state = cache.prepare(SCRIPT)
+    before = {name:snapshot(value) for name, value in state.items()}
+    for _ in range(2):
+        asyncio.run(runner.run_async(cache.get(SCRIPT, {})))
+    assert {name:snapshot(value) for name, value in state.items()} == before
+    assert "scope" not in state
@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip("twitchio")
+pytest.importorskip("tronix")
+import actions
+import command_triggers
+
+def make_plan(params:list, defaults:dict)->command_triggers.InvocationPlan:
+    signature = command_triggers.CommandSignature.__new__(command_triggers.CommandSignature)
+    signature.__setstate__({"params": params, "defaults": defaults})
+    command = command_triggers.Command("shoutout", "", signature, None)
+    mapping = actions.CommandActionValueMapping({"target": "user"}, {"source": "chat"})
+    return command_triggers.InvocationPlan(command, "action", mapping)
+
+@pytest.fixture
+def plan():
+    return make_plan([["target", "text"], ["times", "integer"], ["loud", "true|false"]], {"times": "1", "loud": "false"})
+
+def test_fill_values(plan):
+    assert plan.fill_values(("someone", "3", "yes")) == {"user": "someone", "times": 3, "loud": True, "source": "chat"}
+    assert plan.fill_values(("someone",)) == {"user": "someone", "times": 1, "loud": False, "source": "chat"}
+
+@pytest.mark.parametrize("args", [(), ("someone", "three"), ("someone", "3", "maybe"), ("someone", "3", "yes", "extra")])
+def test_fill_values_rejects(plan, args):
+    with pytest.raises(command_triggers.CommandArgumentException):
+        plan.fill_values(args)
+
+def test_unsupported_type():
+    plan = make_plan([["value", "complex"]], {})
+    with pytest.raises(command_triggers.CommandArgumentException):
+        plan.fill_values(("1j",))
+
+def test_bad_default_invalidates_plan():
+    plan = make_plan([["times", "integer"]], {"times": "lots"})
+    assert not plan.valid
+    assert "times" in plan.problem
+
+def test_to_twitch_command_without_command_info(monkeypatch):
+    monkeypatch.setattr(command_triggers, "load_command", lambda name: None)
+    trigger = command_triggers.ActionCommandTrigger("shoutout", "action", actions.CommandActionValueMapping({}, {}))
+    with pytest.raises(command_triggers.CommandNotFoundException):
+        trigger.to_twitch_command()
@@ -0,0 +1,47 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datafile
+import pytest
+import time
+
+def test_write_atomic_keeps_mode(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("old")
+    os.chmod(path, 0o644)
+    datafile.write_atomic(str(path), "new")
+    assert path.read_text() == "new"
+    assert os.stat(path).st_mode & 0o7777 == 0o644
+
+def test_write_atomic_new_file_uses_umask(tmp_path):
+    path = tmp_path / "data.json"
+    datafile.write_atomic(str(path), "new")
+    assert os.stat(path).st_mode & 0o7777 == datafile.NEW_FILE_MODE
+
+def test_flush_raises_failed_write(tmp_path):
+    writer = datafile.WriteBehindWriter(delay=60)
+    path = str(tmp_path / "missing" / "data.json")
+    writer.write(path, "text")
+    with pytest.raises(OSError):
+        writer.flush(path, raise_errors=True)
+    assert isinstance(writer.error(path), OSError)
+    os.mkdir(tmp_path / "missing")
+    writer.flush(path, raise_errors=True)
+    assert writer.error(path) is None
+
+def test_failing_callback_doesnt_stop_writer(tmp_path):
+    writer = datafile.WriteBehindWriter(delay=0)
+    path = str(tmp_path / "data.json")
+    flushed = []
+    def fail():
+        raise RuntimeError("callback failed")
+    writer.write(path, "text", fail)
+    writer.write(path, "text", lambda: flushed.append(path))
+    for _ in range(200):
+        if not writer.is_pending(path):
+            break
+        time.sleep(0.01)
+    assert not writer.is_pending(path)
+    assert flushed == [path]
+    assert writer._thread.is_alive()
@@ -0,0 +1,63 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import events
+import threading
+import time
+
+def test_replay_nothing_missed_leaves_bucket_idle():
+    container = events.EventBucketContainer()
+    container.dispatch(events.Event("test:a", {}))
+    bucket = container.new_bucket(since=container.seq)
+    assert list(bucket.dump()) == []
+    assert not bucket.wait(0)
+
+def test_replay_no_matching_topics_leaves_bucket_idle():
+    container = events.EventBucketContainer()
+    container.dispatch(events.Event("test:a", {}))
+    bucket = container.new_bucket(topics=["other:*"], since=0)
+    assert list(bucket.dump()) == []
+    assert not bucket.wait(0)
+
+def test_replay_missed_events():
+    container = events.EventBucketContainer()
+    container.dispatch(events.Event("test:a", {"i": 1}))
+    container.dispatch(events.Event("test:a", {"i": 2}))
+    bucket = container.new_bucket(since=1)
+    assert bucket.wait(0)
+    assert [event.data["i"] for event in bucket.dump()] == [2]
+    assert not bucket.wait(0)
+
+def test_submit_gives_up_when_loop_stops(monkeypatch):
+    monkeypatch.setattr(events, "SUBMIT_POLL_INTERVAL", 0.05)
+    collection = events.EventListenerCollection()
+    dispatcher = events.AsyncEventDispatcher(collection, maxsize=1)
+    loop = asyncio.new_event_loop()
+    blocked = asyncio.Event()
+
+    async def stall(event):
+        await blocked.wait()
+    collection.add_listener("test:a", stall)
+
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(dispatcher.run(), loop)
+    assert dispatcher.submit(events.Event("test:a", {}), 1) #taken by the stalled listener
+    assert dispatcher.submit(events.Event("test:a", {}), 1) #fills the queue
+
+    result = []
+    submitter = threading.Thread(target=lambda: result.append(dispatcher.submit(events.Event("test:a", {}))))
+    submitter.start()
+    time.sleep(0.1)
+    assert submitter.is_alive() #waiting for room in the queue
+    loop.call_soon_threadsafe(loop.stop)
+    submitter.join(2)
+    assert not submitter.is_alive()
+    assert result == [False]
+    thread.join(1)
+    for task in asyncio.all_tasks(loop):
+        task.cancel()
+    loop.run_until_complete(asyncio.sleep(0.01))
+    loop.close()
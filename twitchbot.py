@@ -3,14 +3,16 @@ import argparse
 import asyncio
 import command_triggers
 import config
+import datastore
 from datetime import datetime, timedelta
+import eventcodec
 import events
 import inspect
-import json
 import plugins
 import rewards
 from simple_websocket.errors import ConnectionClosed
 import threading
+import time
 import traceback
 from typing import Awaitable, Callable, Self
 import twitchio
@@ -23,6 +25,9 @@ API_ENDPOINT = ""
 API_WS_ENDPOINT = f""
 TOKEN_REFRESH_ENDPOINT = "https://id.twitch.tv/oauth2/token"
 
+#changes are applied as they're announced, full resyncs only catch anything that was missed
+FULL_SYNC_INTERVAL = 300.0
+
 def define_endpoints(host:str, port:int):
     global API_BASE, API_ENDPOINT, API_WS_ENDPOINT
     is_80 = port == 80
@@ -35,6 +40,14 @@ def define_endpoints(host:str, port:int):
     API_ENDPOINT = f"http{s}://{API_BASE}"
     API_WS_ENDPOINT = f"ws{s}://{API_BASE}"
 
+def events_url(since:int|None=None)->str:
+    query = []
+    if (encodings := eventcodec.preferred_encodings()) is not None:
+        query.append(f"encoding={encodings}")
+    if since is not None:
+        query.append(f"since={since}")
+    return f"{API_WS_ENDPOINT}/events{"?"*bool(query)}{"&".join(query)}"
+
 parser = argparse.ArgumentParser(description="SZBot twitchbot program.")
 parser.add_argument("-d", "--addr", default=f"{web.HOST}:{web.PORT}", help="The address main.py is listening on.")
 parser.add_argument("-p", "--plugin-configs", default=config.PLUGIN_FILE, help="Path to the plugin config file to use.")
@@ -148,12 +161,11 @@ OAUTH_CHANNEL_SCOPES:set[str] = {
     "channel:manage:redemptions"
 }
 
+links_section = config.section("Links")
+
 def _link_command_newfunc(name:str):
     async def func(ctx:commands.Context):
-        configs = config.read()
-        if "Links" not in configs:
-            return
-        links = configs["Links"]
+        links = links_section.get()
         if isinstance(links, dict) and name in links:
             link = links[name]
             if isinstance(link, str):
@@ -173,15 +185,34 @@ class Bot(commands.AutoBot):
             subscriptions=subs,
         )
         self.links_commands:set[str] = set()
+        self._links_version:int|None = None
         self._callback_command_triggers:dict[str, command_triggers.CallbackCommandTrigger] = {}
         self._callback_redeem_handlers:dict[rewards.RewardIdentifierKey, rewards.CallbackRedeemHandler] = {}
         self.command_triggers:dict[str, command_triggers.CommandTrigger] = {}
         self.redeem_handlers:dict[rewards.RewardIdentifierKey, rewards.RedeemHandler] = {}
         self.subs = subs
         self.use_core_commands = use_core_commands
+        self._help_index:command_triggers.HelpIndex|None = None
+        self._data_changes:dict[str, set[str]] = {}
+        self._data_changes_lock = threading.Lock()
+        self._last_full_sync = 0.0
+
+    @property
+    def help_index(self)->command_triggers.HelpIndex:
+        index = self._help_index
+        if index is None:
+            self._help_index = index = command_triggers.HelpIndex(self.command_triggers)
+        return index
+
+    def allowed_commands(self, author:twitchio.Chatter|twitchio.PartialUser|int)->list[str]:
+        """Names of the commands the chatter (or `badge_mask`) meets the requirements for, in the order they were added."""
+        if not isinstance(author, int):
+            author = command_triggers.badge_mask(author)
+        return self.help_index.allowed(author)
 
     def add_command(self, command:command_triggers.CommandTrigger|commands.Command):
         if isinstance(command, command_triggers.CommandTrigger):
+            self._help_index = None
             self.command_triggers[command.name] = command
             if isinstance(command, command_triggers.CallbackCommandTrigger):
                 self._callback_command_triggers[command.name] = command
@@ -192,6 +223,7 @@ class Bot(commands.AutoBot):
         if isinstance(name, command_triggers.CommandTrigger):
             name = name.name
         command = self.command_triggers.pop(name, None)
+        self._help_index = None
         if isinstance(command, command_triggers.CallbackCommandTrigger) and name in self._callback_command_triggers:
             del self._callback_command_triggers[name]
         return super().remove_command(name)
@@ -211,63 +243,111 @@ class Bot(commands.AutoBot):
         pair_title = (payload.reward.title, rewards.IDEN_TYPE_TITLE)
         return self.redeem_handlers.get(pair_id,None), self.redeem_handlers.get(pair_title,None)
 
+    def _set_command_trigger(self, name:str, trigger:command_triggers.ActionCommandTrigger|None):
+        """Replaces the action command with the name and re-registers it, or restores the callback command it was hiding if `trigger` is None."""
+        current = self.command_triggers.get(name, None)
+        if trigger is None and not isinstance(current, command_triggers.ActionCommandTrigger):
+            return #callback commands aren't stored, so there's nothing to remove
+        if current is not None:
+            del self.command_triggers[name]
+            super().remove_command(name)
+        if trigger is None:
+            trigger = self._callback_command_triggers.get(name, None)
+        if trigger is not None:
+            self.add_command(trigger) #also builds the invocation plan
+        self._help_index = None
+
+    def _set_redeem_handler(self, iden:rewards.RewardIdentifier, handler:rewards.ActionRedeemHandler|None):
+        """Replaces the stored redeem handler, or restores the callback handler it was hiding if `handler` is None."""
+        current = self.redeem_handlers.get(iden, None)
+        if isinstance(current, rewards.CallbackRedeemHandler):
+            return #callback handlers take priority over stored ones
+        if handler is None:
+            handler = self._callback_redeem_handlers.get(iden, None)
+        if handler is not None:
+            self.redeem_handlers[iden] = handler
+        elif current is not None:
+            del self.redeem_handlers[iden]
+
+    def queue_data_changes(self, data:dict[str]):
+        """Remembers which stored commands or redeem handlers changed, they're rebuilt by `apply_data_changes`."""
+        table = data.get("table", None)
+        if table not in (command_triggers.command_trigger_store.name, command_triggers.command_store.name, rewards.redeem_handler_store.name):
+            return
+        names = [*data.get("added", ()), *data.get("removed", ()), *data.get("modified", ())]
+        with self._data_changes_lock:
+            self._data_changes.setdefault(table, set()).update(names)
+
+    def apply_data_changes(self):
+        """Rebuilds only the commands and redeem handlers that changed. Every `FULL_SYNC_INTERVAL` seconds everything is resynced instead."""
+        if time.monotonic() - self._last_full_sync >= FULL_SYNC_INTERVAL:
+            return self.full_sync()
+        if not self._data_changes:
+            return
+        with self._data_changes_lock:
+            changes = self._data_changes
+            self._data_changes = {}
+        #a change to a command's info also needs its twitch command re-registered, for the signature
+        command_names = changes.get(command_triggers.command_trigger_store.name, set()) | changes.get(command_triggers.command_store.name, set())
+        for name in command_names:
+            self._set_command_trigger(name, command_triggers.load_command_trigger(name))
+        for key in changes.get(rewards.redeem_handler_store.name, ()):
+            iden = rewards.RewardIdentifier.from_str(key)
+            self._set_redeem_handler(iden, rewards.load_redeem_handler(iden))
+
+    def full_sync(self):
+        with self._data_changes_lock:
+            self._data_changes.clear()
+        self.sync_commands()
+        self.sync_redeem_handlers()
+        self._last_full_sync = time.monotonic()
+
     def sync_commands(self):
         loaded_commands = command_triggers.load_command_triggers()
-        cmd_difference = set(self.command_triggers.keys()) ^ set(loaded_commands.keys())
-        for name in cmd_difference:
-            if name in loaded_commands:
-                self.add_command(loaded_commands[name])
-            else: #name in self.command_triggers
-                cmd = self.command_triggers[name]
-                if isinstance(cmd, command_triggers.CallbackCommandTrigger):
-                    continue #command would be reassigned pointlessly so just do nothing
-                ccmd = self._callback_command_triggers.get(name,None)
-                if ccmd is None:
-                    del self.command_triggers[name]
-                else:
-                    self.command_triggers[name] = ccmd
+        command_data = command_triggers.load_commands()
+        for name in [name for name, cmd in self.command_triggers.items() if isinstance(cmd, command_triggers.ActionCommandTrigger) and name not in loaded_commands]:
+            self._set_command_trigger(name, None)
         for name, lcmd in loaded_commands.items():
-            if name in cmd_difference:
-                continue #was added already
-            cmd = self.command_triggers[name]
-            assert isinstance(cmd, command_triggers.ActionCommandTrigger)
-            cmd.update(lcmd)
-
+            cmd = self.command_triggers.get(name, None)
+            if isinstance(cmd, command_triggers.ActionCommandTrigger) and cmd.__getstate__() == lcmd.__getstate__():
+                info = cmd.command_info()
+                new_info = command_data.get(name, None)
+                if (info is None) == (new_info is None) and (info is None or info.__getstate__() == new_info.__getstate__()):
+                    continue #unchanged
+            self._set_command_trigger(name, lcmd)
+        self._help_index = None
     
     def sync_redeem_handlers(self):
         loaded_redeems = rewards.load_redeem_handlers()
-        rh_difference = set(self.redeem_handlers.keys()) ^ set(loaded_redeems.keys())
-        for iden in rh_difference:
-            if iden in loaded_redeems:
-                self.add_redeem_handler(loaded_redeems[iden])
-            else: #name in self.redeem_handlers
-                rh = self.redeem_handlers[iden]
-                if isinstance(rh, rewards.CallbackRedeemHandler):
-                    continue
-                crh =self._callback_redeem_handlers.get(iden,None)
-                if crh is None:
-                    del self.redeem_handlers[iden]
-                else:
-                    self.redeem_handlers[iden] = crh
+        for iden in [iden for iden, rh in self.redeem_handlers.items() if isinstance(rh, rewards.ActionRedeemHandler) and iden not in loaded_redeems]:
+            self._set_redeem_handler(iden, None)
+        for iden, lrh in loaded_redeems.items():
+            rh = self.redeem_handlers.get(iden, None)
+            if isinstance(rh, rewards.ActionRedeemHandler) and rh.__getstate__() == lrh.__getstate__():
+                continue
+            self._set_redeem_handler(iden, lrh)
 
     def update_link_commands(self):
-        configs = config.read()
-        if "Links" in configs:
-            links:dict[str] = configs["Links"]
-            if isinstance(links, dict):
-                sym_difference = self.links_commands ^ set(links.keys()) #values that aren't in both sets
-                for name in sym_difference:
-                    if name in links:
-                        cb = _link_command_newfunc(name)
-                        ct = command_triggers.CallbackCommandTrigger.new(cb, name)
-                        self.add_command(ct)
-                        self.links_commands.add(name)
-                    else: #name in self.links_commands
-                        self.remove_command(name)
-                        self.links_commands.remove(name)
-                return
+        version = links_section.version
+        if version == self._links_version:
+            return #links haven't changed since the last update
+        self._links_version = version
+        links:dict[str] = links_section.get()
+        if isinstance(links, dict):
+            sym_difference = self.links_commands ^ set(links.keys()) #values that aren't in both sets
+            for name in sym_difference:
+                if name in links:
+                    cb = _link_command_newfunc(name)
+                    ct = command_triggers.CallbackCommandTrigger.new(cb, name)
+                    self.add_command(ct)
+                    self.links_commands.add(name)
+                else: #name in self.links_commands
+                    self.remove_command(name)
+                    self.links_commands.remove(name)
+            return
         for name in self.links_commands:
             self.remove_command(name)
+        self.links_commands.clear()
 
     async def setup_hook(self):
         self.add_listener(self.event_message)
@@ -279,15 +359,14 @@ class Bot(commands.AutoBot):
         resp:twitchio.authentication.ValidateTokenPayload = await super().add_token(token, refresh)
 
         respdata = {"token": token, "refresh_token": refresh}
-        oauth = config.read(config.OAUTH_TWITCH_FILE)
-        channels = oauth.get("channels", None)
         user = await self.fetch_user(id=resp.user_id)
         print("added token for user", user)
-        if isinstance(channels, dict):
-            channels[user.name] = respdata
-        else:
-            channels = {user.name: respdata}
-        config.write(config_updates={"channels": channels}, path=config.OAUTH_TWITCH_FILE)
+        with config.edit(config.OAUTH_TWITCH_FILE) as oauth:
+            channels = oauth.get("channels", None)
+            if isinstance(channels, dict):
+                channels[user.name] = respdata
+            else:
+                oauth["channels"] = {user.name: respdata}
 
     async def event_ready(self):
         await bot.delete_all_eventsub_subscriptions()
@@ -303,8 +382,7 @@ class Bot(commands.AutoBot):
         else:
             print("Successfully subscribed")
 
-        bot.sync_commands()
-        bot.sync_redeem_handlers()
+        bot.full_sync()
 
         print("twitch bot ready")
 
@@ -313,6 +391,7 @@ class Bot(commands.AutoBot):
         if message.chatter.id == self.bot_id:
             return
         self.update_link_commands()
+        self.apply_data_changes()
         await self.process_commands(message)
 
     async def event_command_error(self, payload:commands.CommandErrorPayload):
@@ -323,6 +402,7 @@ class Bot(commands.AutoBot):
             traceback.print_exception(payload.exception)
 
     async def event_custom_redemption_add(self, payload:twitchio.ChannelPointsRedemptionAdd):
+        self.apply_data_changes()
         id_handler, title_handler = self._get_redeem_handlers(payload)
 
         if id_handler and title_handler and id_handler is not title_handler:
@@ -351,45 +431,24 @@ class CoreComponent(commands.Component):
     @command_triggers.CallbackCommandTrigger.create("help")
     async def help_command(self, ctx:commands.Context, command_name:str=None):
         """Lists and describes commands."""
-        self.bot.sync_commands()
-        command_data = command_triggers.load_commands()
+        index = self.bot.help_index
+        author_mask = command_triggers.badge_mask(ctx.author)
 
         if command_name is None:
             #exclude commands that user does not meet requirements for
-            names = []
-            for name, ct in self.bot.command_triggers.items():
-                if isinstance(ct, command_triggers.CallbackCommandTrigger):
-                    cmd = ct.generate_command()
-                elif name in command_data:
-                    cmd = command_data[name]
-                else:
-                    ... #TODO command trigger has no corresponding data
-                if cmd.permissions.meets_requirements(ctx.author):
-                    names.append(name)
-            await ctx.send("Commands: " + ", ".join(names))
+            await ctx.send(index.listing(author_mask))
         elif command_name not in self.bot.commands:
             await ctx.send(f"Command {command_name} does not exist.")
         else:
-            ct = self.bot.command_triggers.get(command_name, None)
-            if ct is None:
+            usage = index.usage(command_name)
+            if usage is None:
                 await ctx.send(f"Command {command_name} has no help info.")
             else:
-                if isinstance(ct, command_triggers.CallbackCommandTrigger):
-                    cmd = ct.generate_command()
-                elif command_name in command_data:
-                    cmd = command_data[command_name]
-                else:
-                    ... #TODO command trigger has no corresponding data
-                
-                if not cmd.permissions.meets_requirements(ctx.author):
+                mask, text = usage
+                if mask & ~author_mask:
                     await ctx.send(f"You cannot use this command.")
                 else:
-                    signature = cmd.signature.generate_str("!", command_name)
-                    r = []
-                    if cmd.description:
-                        r.append(cmd.description)
-                    r.append(f"Usage: {signature}")
-                    await ctx.send(" ".join(r))
+                    await ctx.send(text)
 
 
     @command_triggers.CallbackCommandTrigger.create("links")
@@ -461,7 +520,7 @@ def get_init_ids(client_id, client_secret, bot_name:str, channels:list[str])->tu
 #set up the bot
 def init_bot(old_bot:Bot|None=None):
     m = plugins.parse_plugin_meta(plugins.CORE_CONFIGS_META)
-    c = plugins.config_apply_meta(config.read(), m.configs)
+    c = m.apply(config.read())
     oauth = config.read(path=config.OAUTH_TWITCH_FILE)
     identity = oauth.get("identity", None)
 
@@ -497,6 +556,16 @@ def init_bot(old_bot:Bot|None=None):
         bot.use_core_commands = old_bot.use_core_commands
     return bot
 
+bot:Bot|None = None
+#listeners for events from the events socket run on the bot's loop
+event_dispatcher = events.AsyncEventDispatcher()
+
+@events.listener(datastore.EVENT_DATA_CHANGED)
+def on_data_changed(event:events.Event):
+    #called from the events socket and watcher threads, so the changes are applied on the bot's next event
+    if bot is not None:
+        bot.queue_data_changes(event.data)
+
 
 def ws_on_open(ws):
     print("connected to events socket")
@@ -504,13 +573,20 @@ def ws_on_open(ws):
 def ws_on_reconnect(ws):
     print("reconnected to events socket")
 
-def ws_on_message(ws, msg:str|bytearray|memoryview):
+def ws_on_message(ws:websocket.WebSocketApp, msg:str|bytearray|memoryview):
     if isinstance(msg, memoryview):
         msg = msg.tobytes()
     print("events socket message:", msg)
-    data = json.loads(msg)
+    data = eventcodec.decode(msg)
     event = events.Event(**data)
-    events.handle_event(event)
+    if event.seq is not None:
+        #reconnects pick up from the last event
+        ws.url = events_url(event.seq)
+    if event.name == config.EVENT_CONFIG_CHANGED:
+        return #refers to main.py's snapshots, this process's own watcher reports changes to its listeners
+    #waits while the dispatcher's queue is full, which stops reading from the socket until the bot catches up
+    if not event_dispatcher.submit(event):
+        print("events socket: bot isn't running, dropped", event.name)
 
 def ws_on_error(ws, e:Exception):
     if isinstance(e, (ConnectionRefusedError, ConnectionClosed)):
@@ -529,7 +605,12 @@ def ws_run():
         pass
 
 async def main():
-    await bot.start(load_tokens=False, save_tokens=False)
+    dispatcher_task = asyncio.create_task(event_dispatcher.run())
+    try:
+        await bot.start(load_tokens=False, save_tokens=False)
+    finally:
+        dispatcher_task.cancel()
+        event_dispatcher.close()
 
 if __name__ == "__main__":
     addr, config_path, pconfig_path, components = get_args()
@@ -543,13 +624,19 @@ if __name__ == "__main__":
     modname = os.path.basename(__file__).rsplit(".", 1)[0]
     sys.modules[modname] = this
 
+    #events from the watcher only go to local listeners, main.py already sends them over the events socket
+    config.start_watcher(container=None)
+    #changes to the JSON files are noticed by the watcher, SQLite changes are announced over the events socket
+    for store in (command_triggers.command_trigger_store, command_triggers.command_store, rewards.redeem_handler_store):
+        store.watch()
+
     bot = init_bot()
     if bot is None:
         print("You must run main.py first to make sure your oauth_twitch.json file is fine.\nAlso, make sure to make a config.json file with your bot's \"Prefix\".")
         exit(-1)
 
     ws = websocket.WebSocketApp(
-        f"{API_WS_ENDPOINT}/events",
+        events_url(),
         on_open=ws_on_open, on_message=ws_on_message,
         on_error=ws_on_error, on_close=ws_on_close,
         on_reconnect=ws_on_reconnect
@@ -608,6 +695,7 @@ if __name__ == "__main__":
         if plugin.module is not None:
             plugin.twitch_bot_unload(plugins.TwitchBotUnloadEvent(plugin_list, plugin, True, e))
     print("unloaded plugins")
+    config.stop_watcher()
 
     ws.close()
     ws_thread.join()
@@ -2,10 +2,12 @@ import actions
 import aiohttp
 import asyncio
 import base64
+from collections import deque
 import config
 import datafile
+import eventcodec
 import events
-from flask import abort, Blueprint, Flask, render_template, request, Response, send_file, stream_with_context
+from flask import abort, Blueprint, Flask, render_template, request, Response, stream_with_context
 from flask_sock import Server, Sock
 from gevent.pywsgi import WSGIServer
 import inspect
@@ -16,16 +18,24 @@ import plugins
 import requests
 from simple_websocket.errors import ConnectionClosed
 import threading
+import time
 import traceback
 import tronix
 from typing import Callable, Sequence
 import websocket
 from werkzeug.datastructures import Headers
+from werkzeug.security import safe_join
+import zlib
 
 HOST = "127.0.0.1"
 PORT = 6742
 SECRET_FILE = datafile.makepath("secret.txt")
 API_PROXY_BUFFER_SIZE = 8192
+EVENTS_RECEIVE_INTERVAL = 0.1 #how often /api/events checks for subscription messages while no events come in
+REMOTE_EVENTS_BATCH_WINDOW = 0.01 #how long the remote event forwarder waits for more events before sending a batch
+REMOTE_EVENTS_MAX_BATCH = 256
+REMOTE_EVENTS_BUFFER_SIZE = 4096 #events kept while the remote api can't be reached, the oldest are dropped first
+REMOTE_EVENTS_RETRY_INTERVAL = 1.0
 
 DEFAULT_STYLES_FONT = "\"Fragment Mono\""
 DEFAULT_STYLES_BG_COLOR = "#000000"
@@ -39,9 +49,7 @@ DEFAULT_STYLES = f"""\
     --color-fg: {DEFAULT_STYLES_FG_COLOR};
     --color-fg2: {DEFAULT_STYLES_FG2_COLOR};"""
 
-def build_styles_from_config()->str:
-    c = config.read()
-    style = c.get("Style", None)
+def _build_styles(style:dict[str]|None)->str:
     if isinstance(style, dict):
         fonts_r = style.get("fonts", None)
         if fonts_r is None:
@@ -67,6 +75,11 @@ def build_styles_from_config()->str:
         return "\n    ".join(f"{css_styles[i]}: {css_styles[i+1]};" for i in range(0, len(css_styles), 2))
     else:
         return DEFAULT_STYLES
+
+_config_styles = config.section("Style").derive(_build_styles)
+
+def build_styles_from_config()->str:
+    return _config_styles.get()
     
 
 def load_config_styles_css()->str:
@@ -81,6 +94,14 @@ def load_config_styles_css()->str:
 __host_addr = None
 __remote_api_addr = None
 __pconfig_path = None
+event_forwarder:"RemoteEventForwarder|None" = None
+
+def send_data_file(path:str, mimetype:str="application/json"):
+    """Like send_file, but includes changes that are still waiting to be written to the file."""
+    text = datafile.read_text(path)
+    if text is None:
+        abort(404)
+    return Response(text, 200, mimetype=mimetype)
 
 def serve_when_loaded(loaded_callback:Callable[[], bool], unloaded_error_code:int=404):
     def decor(f:Callable):
@@ -139,17 +160,17 @@ def oauth():
     u = r2.json()
     login = u["data"][0]["login"]
     if login == str(identity["Bot-Name"]).lower():
-        identity.update({"Token": token, "Refresh-Token": refresh})
-        config.write(config_updates={"identity": identity}, path=config.OAUTH_TWITCH_FILE)
+        with config.edit(config.OAUTH_TWITCH_FILE) as oauth:
+            oauth["identity"].update({"Token": token, "Refresh-Token": refresh})
         return "Authenticated bot identity, restart bot.", 200
     else:
-        channels = oauth.get("channels",None)
         tdata = {"token": token, "refresh_token": refresh}
-        if isinstance(channels, dict):
-            channels[login] = tdata
-        else:
-            channels = {login: tdata}
-        config.write(config_updates={"channels": channels}, path=config.OAUTH_TWITCH_FILE)
+        with config.edit(config.OAUTH_TWITCH_FILE) as oauth:
+            channels = oauth.get("channels",None)
+            if isinstance(channels, dict):
+                channels[login] = tdata
+            else:
+                oauth["channels"] = {login: tdata}
         return "Authenticated user channel, you can close this tab.", 200
 
 @coreinterface.get("/configs")
@@ -160,19 +181,80 @@ def configs_page():
 def actions_page():
     return render_template("actions.html")
 
+def get_event_codec()->tuple[eventcodec.Codec|None, bool]:
+    """Returns the codec (None for JSON text) and whether to deflate, that an event socket's client asked for."""
+    return eventcodec.negotiate(request.args.get("encoding", None)), request.args.get("deflate", "0") not in ("", "0", "false")
+
+def send_event(ws:Server, event:events.Event, codec:eventcodec.Codec|None=None, deflate:bool=False):
+    ws.send(event.to_json() if codec is None else event.encode(codec, deflate))
+
+def send_events_batch(ws:Server, batch:list[events.Event], codec:eventcodec.Codec|None=None, deflate:bool=False):
+    ws.send(events.batch_to_json(batch) if codec is None else events.batch_encode(batch, codec, deflate))
+
+def update_events_subscription(bucket:events.EventBucket, msg:str|bytes):
+    """Handles {"topics": [...]}, {"subscribe": [...]} and {"unsubscribe": [...]} messages from /api/events clients."""
+    try:
+        data = eventcodec.decode(msg)
+    except (ValueError, zlib.error):
+        print("api /events message invalid:", msg)
+        return
+    if not isinstance(data, dict):
+        return
+    def get_topics(key:str)->list[str]|None:
+        topics = data.get(key, None)
+        if isinstance(topics, list) and all(isinstance(topic, str) for topic in topics):
+            return topics
+        return None
+    container = events.default_container
+    if (topics := get_topics("topics")) is not None:
+        container.set_topics(bucket, topics)
+    if (topics := get_topics("unsubscribe")) is not None:
+        container.unsubscribe(bucket, *topics)
+    if (topics := get_topics("subscribe")) is not None:
+        container.subscribe(bucket, *topics)
+
 @sock.route("/events", bp=coreapi)
 def api_events(ws:Server):
-    bucket = events.new_bucket()
+    #clients that can fall behind may ask for a different queue size (0 for no limit) and overflow policy
+    capacity = request.args.get("capacity", None, int)
+    overflow = request.args.get("overflow", None)
+    if overflow is not None and overflow not in events.OVERFLOW_POLICIES:
+        ws.close(1008, f"unknown overflow policy {overflow}")
+        return
+    #comma separated event names and prefixes ending in "*", every event is sent without any
+    topics = request.args.get("topics", None)
+    if topics is not None:
+        topics = [topic for topic in topics.split(",") if topic]
+    #batch=1 sends a list of all the events that are ready in one message
+    batched = request.args.get("batch", "0") not in ("", "0", "false")
+    #reconnecting clients pass the seq of the last event they got, to get the ones they missed first
+    since = request.args.get("since", None, int)
+    codec, deflate = get_event_codec()
+    bucket = events.new_bucket(capacity=... if capacity is None else capacity if capacity > 0 else None, overflow=overflow, topics=topics, since=since)
     try:
         while ws.connected:
-            bucket.wait()
-            for event in bucket.dump():
-                ws.send(event.to_json())
+            if bucket.wait(EVENTS_RECEIVE_INTERVAL):
+                if batched:
+                    batch = list(bucket.dump())
+                    if batch:
+                        send_events_batch(ws, batch, codec, deflate)
+                else:
+                    for event in bucket.dump():
+                        send_event(ws, event, codec, deflate)
+                if bucket.closed:
+                    ws.close(1008, "event queue overflowed")
+                    break
+            while (msg := ws.receive(0)) is not None:
+                update_events_subscription(bucket, msg)
     except KeyboardInterrupt:
         ws.close()
     finally:
         events.remove_bucket(bucket)
 
+@coreapi.get("/events/metrics")
+def api_events_metrics():
+    return events.default_container.metrics(), 200
+
 @coreapi.post("/events/dispatch")
 def api_events_dispatch():
     batch:list[dict[str]] = json.loads(request.form["batch"])
@@ -181,14 +263,26 @@ def api_events_dispatch():
     events.dispatch(*(events.Event(**data) for data in batch if isinstance(data, dict)))
     return "", 200
 
+def saved_response(path:str):
+    """Response for handlers that queued a write to the file. The write happens in the background, so the status only
+    has errors from earlier writes, editors poll /api/datafile/status to find out how this one went."""
+    return datafile.status(path), 200
+
+@coreapi.get("/datafile/status")
+def api_datafile_status():
+    path = safe_join(datafile.DATA_DIR, request.args["name"])
+    if path is None:
+        abort(404)
+    return datafile.status(path), 200
+
 @coreapi.route("/configs", methods=["GET", "PUT"])
 def api_configs():
     if request.method == "PUT":
         data = request.get_json()
         config.write(data, path=config.CONFIG_FILE)
-        return "", 200
+        return saved_response(config.CONFIG_FILE)
     else:
-        return send_file(config.CONFIG_FILE)
+        return send_data_file(config.CONFIG_FILE)
 
 @coreapi.get("/configs/meta")
 def api_configs_meta():
@@ -245,7 +339,10 @@ def api_actions_script_check():
 
 @coreapi.get("/action/list")
 def api_actions_list():
-    return send_file(actions.ACTIONS_PATH)
+    text = actions.action_store.dumps()
+    if text is None:
+        abort(404)
+    return Response(text, 200, mimetype="application/json")
 
 @coreapi.route("/action", methods=["GET", "POST", "DELETE"])
 def api_action_route():
@@ -254,22 +351,21 @@ def api_action_route():
         data:dict[str] = request.json
         if not isinstance(data, dict):
             return "", 400
-        table = actions.load_action_table()
-        action = table.get(name, None)
+        action = actions.load_action(name)
         if action is None:
-            table[data.setdefault("name", name)] = action = actions.Action.__new__(actions.Action)
+            data.setdefault("name", name)
+            action = actions.Action.__new__(actions.Action)
             data.setdefault("requested_values", {})
         action.__setstate__(data)
-        actions.save_action_table(table)
-        return "", 200
+        if action.name != name:
+            actions.delete_action(name)
+        actions.save_action(action)
+        return saved_response(actions.ACTIONS_PATH)
     elif request.method == "DELETE":
-        table = actions.load_action_table()
-        if name in table:
-            del table[name]
-            actions.save_action_table(table)
-        return "", 200
+        actions.delete_action(name)
+        return saved_response(actions.ACTIONS_PATH)
     else: #GET
-        action = actions.load_action_table().get(name, None)
+        action = actions.load_action(name)
         if action is None:
             return "", 400
         else:
@@ -285,7 +381,7 @@ def api_action_script_run():
         scope = pickle.loads(base64.b64decode(scope_s.encode("utf-8")))
     else:
         scope = None
-    script = tronix.Script(data["script"], scope)
+    script = actions.script_cache.get(data["script"], scope)
 
     if rtype == "run_iter":
         def gen():
@@ -307,7 +403,90 @@ def api_action_script_run():
     else:
         return "", 422
 
+class RemoteEventForwarder:
+    """Sends dispatched events to a remote api's /events/dispatch from a background thread.
+
+    Events dispatched within `batch_window` seconds of each other are sent in one request over a kept-alive session.
+    While the remote can't be reached, up to `buffer_size` events are kept and sending is retried."""
+    def __init__(self, url:str, batch_window:float=REMOTE_EVENTS_BATCH_WINDOW, max_batch:int=REMOTE_EVENTS_MAX_BATCH,
+                 buffer_size:int=REMOTE_EVENTS_BUFFER_SIZE, retry_interval:float=REMOTE_EVENTS_RETRY_INTERVAL):
+        self.url = url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.retry_interval = retry_interval
+        self.session = requests.Session()
+        self.buffer:deque[events.Event] = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.sent = 0
+        self.running = False
+        self._cond = threading.Condition()
+        self._thread:threading.Thread|None = None
+
+    def _extend(self, e:Sequence[events.Event]):
+        overflow = len(self.buffer) + len(e) - self.buffer.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+        self.buffer.extend(e)
+
+    def dispatch(self, *e:events.Event):
+        with self._cond:
+            self._extend(e)
+            self._cond.notify()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="remote events", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout:float|None=5):
+        """Stops after trying to send what's left in the buffer."""
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _take_batch(self)->list[events.Event]:
+        with self._cond:
+            return [self.buffer.popleft() for _ in range(min(len(self.buffer), self.max_batch))]
+
+    def _send(self, batch:list[events.Event])->bool:
+        try:
+            r = self.session.post(self.url, data={"batch": events.batch_to_json(batch)})
+            r.raise_for_status()
+        except requests.RequestException as e:
+            print(f"remote events: could not send {len(batch)} events ({type(e).__name__}):", e)
+            with self._cond:
+                #put the batch back in front of anything dispatched since
+                newer = list(self.buffer)
+                self.buffer.clear()
+                self._extend(batch)
+                self._extend(newer)
+            return False
+        self.sent += len(batch)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.running and not self.buffer:
+                    self._cond.wait()
+                if not self.running:
+                    break
+                full = len(self.buffer) >= self.max_batch
+            if not full:
+                time.sleep(self.batch_window)
+            if not self._send(self._take_batch()):
+                time.sleep(self.retry_interval)
+        while self.buffer:
+            if not self._send(self._take_batch()):
+                break
+
 class ProxyScriptRunner(tronix.utils.ScriptRunner):
+    prepare_locally = False #the remote api parses and compiles the scripts (and reports their errors)
 
     @staticmethod
     def update_scope(runner:tronix.utils.ScriptRunner, script:tronix.Script):
@@ -543,17 +722,23 @@ def attach_core(interface_mode:str, api_mode:str, tronix_mode:str, remote_api_ad
         api.register_blueprint(coreapi)
     elif api_mode == plugins.COMPONENT_MODE_REMOTE:
         vcoreapi = Blueprint("proxy_core_api", __name__)
-        for p in ["/configs", "/configs/meta", "/plugins/load", "/plugins/unload", "/events/dispatch"]:
+        for p in ["/configs", "/configs/meta", "/plugins/load", "/plugins/unload", "/events/dispatch", "/events/metrics"]:
             create_endpoint_proxy(remote_api_addr, [p], vcoreapi, socket=False, endpoint_name=p[1:].replace("/", "_"))
         create_endpoint_proxy(remote_api_addr, ["/events"], vcoreapi, normal=False, endpoint_name="events")
         api.register_blueprint(vcoreapi)
         #replace default_container.dispatch so that all events for the default event system get sent to the remote instance
-        def proxy_dispatch(*e:events.Event):
-            batch = [{"name":event.name, "data":event.data} for event in e]
-            r = requests.post(f"http{"s"*(__host_addr[1]==443)}://{__host_addr[0]}:{__host_addr[1]}/api/events/dispatch", data={"batch":json.dumps(batch)})
-            r.raise_for_status()
-        events.default_container.dispatch = proxy_dispatch
-
+        global event_forwarder
+        processed_api_addr, secure = process_remote_api(remote_api_addr)
+        event_forwarder = RemoteEventForwarder(f"http{"s"*secure}://{processed_api_addr}/api/events/dispatch")
+        event_forwarder.start()
+        events.default_container.dispatch = event_forwarder.dispatch
+
+
+def detach_core():
+    global event_forwarder
+    if event_forwarder is not None:
+        event_forwarder.stop()
+        event_forwarder = None
 
 def serve(host:str=HOST, port:int=PORT, pconfig_path:str=config.PLUGIN_FILE):
     global __host_addr, __pconfig_path